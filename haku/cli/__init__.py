@@ -1,13 +1,13 @@
 import os
 from pathlib import Path
-from typing import Optional, Pattern
+from typing import Optional, Pattern, Tuple
 
 import click
 import cloup
 
 from haku.cli.controllers import (
     cc,
-    convert_pdf,
+    convert_manga,
     display_info,
     download,
     export_dotfile,
@@ -15,6 +15,11 @@ from haku.cli.controllers import (
     update,
 )
 from haku.cli.types import EditorType, FilterType, ReType
+from haku.export import Workers
+from haku.raw.engine import Engine
+from haku.raw.fs import Dotman
+from haku.raw.retry import RetryPolicy
+from haku.raw.transcoder import Transcoder
 from haku.shelf import Filter
 from haku.utils import tmpdir
 from haku.utils.cli import Console
@@ -24,7 +29,7 @@ C_WIDTH = 100
 
 
 @cloup.command(context_settings=CONTEXT_SETTINGS)
-@click.argument("url", required=False)
+@click.argument("urls", nargs=-1)
 @cloup.option_group(
     "Basic usage",
     cloup.option(
@@ -37,7 +42,7 @@ C_WIDTH = 100
     cloup.option(
         "-c",
         "--convert",
-        type=click.Choice(["pdf"], case_sensitive=False),
+        type=click.Choice(["pdf", "cbz", "epub"], case_sensitive=False),
     ),
     cloup.option(
         "-m",
@@ -51,6 +56,12 @@ C_WIDTH = 100
     cloup.option("-i", "--info", is_flag=True),
     cloup.option("-C", "--show-chapters", is_flag=True),
     cloup.option("-e", "--export", is_flag=True),
+    cloup.option(
+        "--dotfile",
+        type=click.Choice(Dotman.FORMATS, case_sensitive=False),
+        default="yaml",
+        show_default=True,
+    ),
 )
 @cloup.option_group(
     "Filters",
@@ -62,7 +73,13 @@ C_WIDTH = 100
     "Fetch / Download",
     cloup.option("-r", "--re", type=ReType("index")),
     cloup.option("--batch-size", type=int, default=100, show_default=True),
-    cloup.option("--rate-limit", type=int, default=100, show_default=True),
+    cloup.option("--rate-limit", type=float, default=0, show_default=True),
+    cloup.option("--concurrency", type=int, default=8, show_default=True),
+    cloup.option("--retries", type=int, default=5, show_default=True),
+    cloup.option("--passthrough", is_flag=True),
+    cloup.option("-p", "--pipeline", is_flag=True),
+    cloup.option("--transcode-workers", type=int, show_default="cpu count"),
+    cloup.option("--transcode-processes", is_flag=True),
 )
 @cloup.option(
     "--editor",
@@ -72,18 +89,25 @@ C_WIDTH = 100
 )
 @cloup.option("--clear-cache", is_flag=True)
 def main(
-    url: Optional[str],
+    urls: Tuple[str],
     out: str,
     convert: Optional[str],
     merge: Optional[str],
     yes: bool,
     info: bool,
     export: bool,
+    dotfile: str,
     filters: Optional[Filter],
     ignore: Optional[Filter],
     re: Optional[Pattern],
     batch_size: int,
-    rate_limit: int,
+    rate_limit: float,
+    concurrency: int,
+    retries: int,
+    passthrough: bool,
+    pipeline: bool,
+    transcode_workers: Optional[int],
+    transcode_processes: bool,
     editor: str,
     show_chapters: bool,
     override_volumes: str,
@@ -91,35 +115,61 @@ def main(
 ):
     """Haku cli"""
 
-    if url is not None:
+    if len(urls) > 0:
 
         out = Path(out)
-        shelf, scraper = fetch(
-            Console(columns=C_WIDTH), url, re, filters, ignore, not info
-        )
+        with Engine(limit_per_host=concurrency) as engine:
+            # when pipelining, pages are fetched while downloading
+            pages = not (info or pipeline)
+            shelves, scrapers = [], []
+            for url in urls:
+                shelf, scraper = fetch(
+                    Console(columns=C_WIDTH), url, re, filters, ignore, pages, engine
+                )
 
-        shelf.override_volumes(override_volumes)
-        shelf = shelf if yes else update(shelf, editor)
+                shelf.override_volumes(override_volumes)
+                shelves.append(shelf if yes else update(shelf, editor))
+                scrapers.append(scraper)
 
-        if info:
-            display_info(Console(), shelf, show_chapters)
-            return
+            if info:
+                for shelf in shelves:
+                    display_info(Console(), shelf, show_chapters)
+                return
 
-        if export:
-            export_dotfile(out, shelf)
-            return
+            if export:
+                for shelf in shelves:
+                    export_dotfile(out, shelf, fmt=dotfile)
+                return
 
-        tree = download(
-            Console(columns=C_WIDTH),
-            out if convert is None else tmpdir(),
-            shelf,
-            scraper,
-            batch_size,
-            rate_limit,
-        )
+            trees = download(
+                Console(columns=C_WIDTH),
+                out if convert is None else tmpdir(),
+                shelves,
+                scrapers,
+                batch_size,
+                rate_limit,
+                concurrency,
+                passthrough,
+                pipeline,
+                Transcoder(transcode_workers, transcode_processes),
+                RetryPolicy(attempts=retries),
+                engine,
+                dotfile,
+            )
 
-        if convert == "pdf":
-            convert_pdf(Console(columns=C_WIDTH), tree, shelf, out, merge)
+        if convert is not None:
+            with Workers() as workers:
+                for tree, shelf in zip(trees, shelves):
+                    convert_manga(
+                        Console(columns=C_WIDTH),
+                        tree,
+                        shelf,
+                        out,
+                        convert.lower(),
+                        merge,
+                        dotfile,
+                        workers,
+                    )
 
     if clear_cache:
         cc(Console(columns=C_WIDTH))
@@ -1,16 +1,20 @@
-from multiprocessing import Manager
 from pathlib import Path
-from typing import Optional, Pattern, Tuple
+from typing import List, Optional, Pattern, Tuple
 
 import click
 
 from haku.exceptions import NoProviderFound
-from haku.export import Merge
+from haku.export import Merge, Workers
+from haku.export.cbz import Cbz
+from haku.export.epub import Epub
 from haku.export.pdf import Pdf
 from haku.meta import Manga
 from haku.provider import Scraper, route
-from haku.raw.downloader import Downloader, Method
+from haku.raw.downloader import Batch, Downloader, Method
+from haku.raw.engine import Engine
 from haku.raw.fs import Dotman, FTree, Reader
+from haku.raw.retry import RetryPolicy
+from haku.raw.transcoder import Transcoder
 from haku.shelf import Filter, Shelf
 from haku.utils import cleanup_folder, tmpdir
 from haku.utils.cli import Console
@@ -18,6 +22,8 @@ from haku.utils.cli.progress import Loader, Progress
 from haku.utils.cli.renderable import Align, Text
 from haku.utils.cli.table import Table
 
+CONVERTERS = {"pdf": Pdf, "cbz": Cbz, "epub": Epub}
+
 
 def fetch(
     console: Console,
@@ -26,6 +32,7 @@ def fetch(
     filters: Optional[Filter],
     ignore: Optional[Filter],
     pages: bool,
+    engine: Optional[Engine] = None,
 ) -> Optional[Tuple[Shelf, Scraper]]:
     """Check if `url` is routable as a provider or is a `.haku` file,
     then try to fetch manga info"""
@@ -41,7 +48,7 @@ def fetch(
         try:
             scraper = route(url)
             scraper.provider.re_chapter_title = re or scraper.provider.re_chapter_title
-            shelf = scraper.fetch_sync(merged_filters, fetch_pages=pages)
+            shelf = scraper.fetch_sync(merged_filters, pages, engine)
             return shelf, scraper
         except NoProviderFound:
             pass
@@ -52,8 +59,12 @@ def fetch(
             manga = Dotman(path.parent, name=path.name).read()
             scraper = route(manga.url)
 
+            # fetch only the pages of new or changed chapters
             if scraper.provider.force_fetch:
-                return scraper.fetch_sync(merged_filters, fetch_pages=pages), scraper
+                shelf, _ = scraper.fetch_incremental_sync(
+                    manga, merged_filters, pages, engine
+                )
+                return shelf, scraper
 
             return Shelf(manga).filter(merged_filters), scraper
 
@@ -112,46 +123,91 @@ def display_info(console: Console, shelf: Shelf, show_chapters: bool):
     console.print(table)
 
 
-def export_dotfile(out: Path, shelf: Shelf, name: bool = True):
-    """Export .haku file to out"""
+def export_dotfile(out: Path, shelf: Shelf, name: bool = True, fmt: str = "yaml"):
+    """Export .haku file to out, in the given format"""
 
-    manager = Dotman(out, name=f"{shelf.manga.title}.haku" if name else ".haku")
+    manager = Dotman(
+        out, name=f"{shelf.manga.title}.haku" if name else ".haku", fmt=fmt
+    )
     manager.dump(shelf.manga)
 
 
 def download(
     console: Console,
     out: Path,
-    shelf: Shelf,
-    scraper: Scraper,
+    shelves: List[Shelf],
+    scrapers: List[Scraper],
     batch_size: int,
-    rate_limit: int,
-) -> FTree:
-    """Check for already existent data and download missing"""
+    rate_limit: float,
+    concurrency: int,
+    passthrough: bool = False,
+    pipeline: bool = False,
+    transcoder: Optional[Transcoder] = None,
+    retry: Optional[RetryPolicy] = None,
+    engine: Optional[Engine] = None,
+    dotfile: str = "yaml",
+) -> List[FTree]:
+    """Check for already existent data and download missing, for all the
+    shelves at once.
+    If `passthrough`, pages are stored with their original encoding,
+    otherwise they are transcoded on `transcoder`.
+    If `pipeline`, pages are fetched while downloading.
+    Recovery plans are written in the `dotfile` format"""
+
+    batch = Batch()
+    workers = max(1, batch_size // len(shelves))
+    n_pages = 0
+
+    for shelf, scraper in zip(shelves, scrapers):
+        tree = FTree(out, shelf.manga, ext=None if passthrough else "png")
+        tree.dotman.fmt = dotfile
+
+        if pipeline:
+            # missing pages are counted as soon as they are queued
+            manga = shelf.manga
+            method = Method.pipeline(scraper, workers)
+            n_pages += 1
+
+        else:
+            # check for missinng data
+            manga = Reader(tree).missing()
+            method = Method.stream(workers)
+            n_pages += sum((len(chapter.pages) for chapter in manga.chapters)) + 1
+
+        batch.add(Downloader(scraper, manga, tree), method)
 
-    # check for missinng data
-    tree = FTree(out, shelf.manga)
-    reader = Reader(tree)
-    missing = reader.missing()
-
-    n_pages = sum((len(chapter.pages) for chapter in missing.chapters)) + 1
     with Progress(console, n_pages, description="Dowloading...") as bar:
-        downloader = Downloader(scraper, missing, tree)
-        downloader.endpoints.on("page.end", lambda *_: bar(1))
+        for downloader, _ in batch.jobs:
+            downloader.endpoints.on("page.end", lambda *_: bar(1))
+            downloader.endpoints.on("pages.queued", lambda _, p: bar.extend(len(p)))
+
+        trees = batch.download(
+            rate_limit=rate_limit,
+            concurrency=concurrency,
+            engine=engine,
+            transcoder=transcoder,
+            retry=retry,
+        )
 
-        return downloader.download(Method.batch(batch_size), rate_limit=rate_limit)
+    for downloader, err in batch.errors:
+        console.print(f"Failed to download {downloader.manga.title}: {err!r}")
 
+    return trees
 
-def convert_pdf(
+
+def convert_manga(
     console: Console,
     src: FTree,
     shelf: Shelf,
     destination: Path,
+    fmt: str,
     merge: Optional[str],
+    dotfile: str = "yaml",
+    workers: Optional[Workers] = None,
 ):
-    """Convert to pdf"""
+    """Convert to the `fmt` format, on the persistent `workers` if given"""
 
-    pdf = Pdf(shelf.manga, src, destination if merge is None else src)
+    converter = CONVERTERS[fmt](shelf.manga, src, destination, workers)
 
     with Progress(
         console,
@@ -159,27 +215,16 @@ def convert_pdf(
         description="Converting...",
     ) as bar:
 
-        manager = Manager()
-        shared_dict = manager.dict()
-        shared_dict["tot"] = 0
-
-        def update(c):
-            if c.index not in shared_dict:
-                shared_dict["tot"] += 1
-                bar.to(shared_dict["tot"])
-
-            shared_dict[c.index] = True
-
-        pdf.on("chapter.end", update)
-        pdf.convert()
+        converter.on("chapter.end", lambda *_: bar(1))
 
-    if merge is not None:
-        with Loader(console, "Merging..."):
+        if merge is None:
+            converter.convert()
+        else:
             merge = {"volume": Merge.volume, "manga": Merge.manga}[merge]
-            pdf.merge(merge(), destination)
+            converter.convert_merged(merge(), destination)
 
     # TODO(me) move to Converter
-    export_dotfile(destination / shelf.manga.title, shelf, False)
+    export_dotfile(destination / shelf.manga.title, shelf, False, dotfile)
 
 
 def cc(console: Console):
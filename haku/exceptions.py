@@ -1,2 +1,28 @@
+from typing import Optional
+
+
 class NoProviderFound(Exception):
     """Raised when no providers are found"""
+
+
+class UnexpectedResponse(Exception):
+    """Raised when a response has an unexpected status"""
+
+    def __init__(self, url: str, status: int, retry_after: Optional[str] = None):
+        super().__init__(f"Unexpected status {status} from {url}")
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+class UnsupportedDotfile(Exception):
+    """Raised when a dotfile has a newer format version than supported"""
+
+    def __init__(self, version: int, supported: int):
+        super().__init__(f"Unsupported dotfile version {version} (max {supported})")
+        self.version = version
+        self.supported = supported
+
+
+class InvalidDotfile(Exception):
+    """Raised when a dotfile can't be read"""
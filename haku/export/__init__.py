@@ -1,9 +1,7 @@
-import asyncio
-from multiprocessing import Manager, Pool
+from contextlib import contextmanager
+from multiprocessing import Pool, SimpleQueue
 from pathlib import Path
-from typing import Any, Callable, List, Optional, Tuple, Union
-
-from PIL import Image
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
 
 from haku.meta import Chapter, Manga, Page
 from haku.raw.fs import FTree, Reader
@@ -42,63 +40,201 @@ class Merge:
         return method
 
 
+def run_job(job: Tuple[int, type, str, Tuple]) -> Tuple[int, Any]:
+    """Run a conversion job, `(id, converter class, method name, args)`, in a
+    worker process"""
+
+    i, cls, method, args = job
+    return i, getattr(cls, method)(*args)
+
+
+class Workers:
+    """Pool of conversion worker processes, reusable among conversions.
+    Events emitted by the workers are forwarded on `queue`"""
+
+    def __init__(self, processes: Optional[int] = None):
+        self.queue = SimpleQueue()
+        self.pool = Pool(
+            processes=processes,
+            initializer=eventh.Handler.forward_to,
+            initargs=(self.queue,),
+        )
+
+    def close(self):
+        """Wait for the workers to exit"""
+
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
 class Converter(eventh.Handler):
-    """Convert manga"""
+    """Convert manga.
+
+    Chapters are converted on a pool of processes, sending each worker only a
+    compact job with the paths of the pages to convert. The biggest jobs are
+    scheduled first. Persistent `workers` can be shared among conversions.
+    Events emitted in the workers are dispatched by the converter
+    """
+
+    EXT: str = ""
+    FMT_CHAPTER: str = "{index:g} {title}"
 
     def __init__(
         self,
         manga: Union[Manga, Shelf],
         reader: Union[Reader, FTree],
         out: Union[FTree, Path],
+        workers: Optional[Workers] = None,
     ):
+        super().__init__()
         self.manga = manga if isinstance(manga, Manga) else manga.manga
         self.out = out if isinstance(out, FTree) else FTree(out, self.manga)
         self.reader = reader if isinstance(reader, Reader) else Reader(reader)
+        self.workers = workers
+        self.merge_data: List[Tuple[Chapter, Any]] = []
+
+        # manga meta without chapters, to be sent to workers
+        self.meta = Manga(**self.manga.as_dict(add_chapters=False))
+
+    @contextmanager
+    def borrow(self, processes: Optional[int] = None) -> Iterator[Workers]:
+        """Use the persistent workers if given, otherwise new workers closed on
+        exit"""
+
+        if self.workers is not None:
+            yield self.workers
+            return
+
+        with Workers(processes) as workers:
+            yield workers
+
+    def pages(self, chapter: Chapter) -> List[Tuple[Page, Path]]:
+        """Get the sorted pages of a chapter, with their paths"""
+
+        pages = list(self.reader.tree.flatten(chapter, resolve=True))
+        pages.sort(key=lambda page: page[0].index)
+        return pages
+
+    def run(
+        self,
+        jobs: List[Tuple[int, List[Chapter], str, Tuple]],
+        processes: Optional[int] = None,
+    ) -> Iterator[Tuple[List[Chapter], Any]]:
+        """Run `(size, chapters, method name, args)` jobs on the pool, biggest
+        first, yielding their chapters and results as they complete"""
+
+        jobs = sorted(jobs, key=lambda job: job[0], reverse=True)
+        tasks = [
+            (i, type(self), method, args) for i, (_, _, method, args) in enumerate(jobs)
+        ]
+
+        with self.borrow(processes) as workers, self.relay(workers.queue):
+            for i, result in workers.pool.imap_unordered(run_job, tasks):
+                yield jobs[i][1], result
 
     def convert(self, processes: Optional[int] = None):
         """Convert a manga"""
 
         self._prepare()
+        self.merge_data = []
 
-        manager = Manager()
-        self.merge_data = manager.list()
+        jobs = []
+        for chapter in self.manga.chapters:
+            pages = self.pages(chapter)
+            out = self.out.chapter(chapter, fmt=f"{self.FMT_CHAPTER}.{self.EXT}")
+            job = (self.meta, self.strip(chapter), pages, out)
+            jobs.append((len(pages), [chapter], "_convert_chapter", job))
+            self.dispatch("chapter", chapter)
 
-        with Pool(processes=processes) as pool:
-            pool.map(self.conver_chapter, self.manga.chapters)
+        for (chapter,), result in self.run(jobs, processes):
+            self.merge_data.append(result)
+            self.dispatch(self.endkey("chapter"), chapter)
 
         self._followup()
 
-    def conver_chapter(self, chapter: Chapter) -> bool:
-        """Convert a chapter"""
+    def convert_merged(
+        self,
+        method: Merge.MergeCallable,
+        dest: Union[FTree, Path],
+        processes: Optional[int] = None,
+    ):
+        """Convert a manga straight into merged files, split by `method`"""
 
-        self.dispatch("chapter", chapter)
-        images = asyncio.run(self.reader.chapter(chapter))
-        images.sort(key=lambda image: image[0].index)
+        self._prepare()
+
+        dest = dest if isinstance(dest, FTree) else FTree(dest, self.manga)
+        chunks = method(
+            [(chapter, None) for chapter in self.manga.chapters], self.manga
+        )
+
+        jobs = []
+        for chunk, name in chunks:
+            chapters = sorted((chapter for chapter, _ in chunk), key=lambda c: c.index)
+            pages = [(self.strip(chapter), self.pages(chapter)) for chapter in chapters]
+            size = sum(len(chapter_pages) for _, chapter_pages in pages)
+            job = (self.meta, pages, dest.root / f"{name}.{self.EXT}")
+            jobs.append((size, chapters, "_convert_merged", job))
+
+        # chapter events are emitted by the workers
+        dest.root.mkdir(parents=True, exist_ok=True)
+        for _ in self.run(jobs, processes):
+            pass
 
-        should_cleanup, chapter = self._convert_chapter(chapter, images)
-        self.merge_data.append(chapter)
+        self._followup()
 
-        if should_cleanup:
-            for page, image in images:
-                image.close()
+    @staticmethod
+    def strip(chapter: Chapter) -> Chapter:
+        """Get a copy of a chapter without pages, to be sent to workers"""
 
-        self.dispatch(self.endkey("chapter"), chapter)
+        return Chapter(**chapter.as_dict(add_pages=False))
 
     def merge(self, method: Merge.MergeCallable, dest: Path):
         """Merge chapters"""
 
-        if not hasattr(self, "merge_data"):
+        if len(self.merge_data) == 0:
             return
 
         dest = dest if isinstance(dest, FTree) else FTree(dest, self.manga)
         for chunk, name in method(self.merge_data, self.manga):
             self._merge(chunk, dest.root, name)
 
+    @classmethod
+    def stream(
+        cls, chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]]
+    ) -> Iterator[Tuple[Chapter, int, Page, Path]]:
+        """Iterate the pages of a series of chapters, with their position in
+        the chapter, emitting chapter and page events"""
+
+        for chapter, pages in chapters:
+            cls.emit("chapter", chapter)
+            for i, (page, path) in enumerate(pages):
+                yield chapter, i, page, path
+                cls.emit(cls.endkey("page"), page)
+            cls.emit(cls.endkey("chapter"), chapter)
+
+    @classmethod
     @abstract
     def _convert_chapter(
-        self, chapter: Chapter, pages: List[Tuple[Page, Image.Image]]
-    ) -> Tuple[bool, Tuple[Chapter, Any]]:
-        """Convert a chapter"""
+        cls, manga: Manga, chapter: Chapter, pages: List[Tuple[Page, Path]], out: Path
+    ) -> Tuple[Chapter, Any]:
+        """Convert a chapter to `out`, given the paths of its pages"""
+
+    @classmethod
+    @abstract
+    def _convert_merged(
+        cls,
+        manga: Manga,
+        chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]],
+        out: Path,
+    ):
+        """Convert a series of chapters to the single file `out`, given the
+        paths of their pages"""
 
     def _followup(self):
         """Executed after all the chapters have been converted"""
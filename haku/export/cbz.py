@@ -0,0 +1,123 @@
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+from xml.etree import ElementTree
+from zipfile import ZIP_STORED, ZipFile
+
+from haku.export import Converter
+from haku.meta import Chapter, Manga, Page
+
+
+class Cbz(Converter):
+    """Cbz converter.
+
+    Pages are stored in the archive as they are, without compression, along
+    with a `ComicInfo.xml` describing the series
+    """
+
+    EXT: str = "cbz"
+    FMT_PAGE: str = "{number:04d}{suffix}"
+    FMT_BOOKMARK: str = "{index:g} {title}"
+
+    @classmethod
+    def comic_info(
+        cls,
+        manga: Manga,
+        chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]],
+        title: str,
+    ) -> bytes:
+        """Build the `ComicInfo.xml` of a series of chapters"""
+
+        root = ElementTree.Element("ComicInfo")
+
+        def add(tag: str, value: Any):
+            if value is not None:
+                ElementTree.SubElement(root, tag).text = str(value)
+
+        volumes = {chapter.volume for chapter, _ in chapters}
+        volume = volumes.pop() if len(volumes) == 1 else None
+
+        # elements follow the order of the ComicInfo schema sequence
+        single = chapters[0][0] if len(chapters) == 1 else None
+        add("Title", title)
+        add("Series", manga.title)
+        if single is not None:
+            add("Number", f"{single.index:g}")
+        if volume is not None and float(volume).is_integer():
+            add("Volume", int(volume))
+        if single is not None:
+            add("Web", single.url)
+        add("PageCount", sum(len(pages) for _, pages in chapters))
+        add("Manga", "Yes")
+
+        # bookmark the first page of each chapter
+        pages = ElementTree.SubElement(root, "Pages")
+        number = 0
+        for chapter, chapter_pages in chapters:
+            for i, _ in enumerate(chapter_pages):
+                attributes: Dict[str, str] = {"Image": str(number)}
+                if i == 0:
+                    attributes["Bookmark"] = cls.FMT_BOOKMARK.format(
+                        index=chapter.index,
+                        title=chapter.title,
+                        volume=chapter.volume,
+                    )
+                ElementTree.SubElement(pages, "Page", attributes)
+                number += 1
+
+        return ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+    @classmethod
+    def write(
+        cls,
+        manga: Manga,
+        chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]],
+        out: Path,
+        title: str,
+        paths: Iterator[Path],
+    ):
+        """Write the pages at `paths`, belonging to a series of chapters, into
+        a single archive"""
+
+        with ZipFile(out, "w", compression=ZIP_STORED) as archive:
+            for number, path in enumerate(paths):
+                name = cls.FMT_PAGE.format(number=number, suffix=path.suffix)
+                archive.write(path, name)
+
+            archive.writestr("ComicInfo.xml", cls.comic_info(manga, chapters, title))
+
+    @classmethod
+    def _convert_chapter(
+        cls,
+        manga: Manga,
+        chapter: Chapter,
+        pages: List[Tuple[Page, Path]],
+        out: Path,
+    ) -> Tuple[Chapter, Path]:
+        """Convert a chapter, storing its pages"""
+
+        def paths():
+            for page, path in pages:
+                yield path
+                cls.emit(cls.endkey("page"), page)
+
+        title = cls.FMT_CHAPTER.format(
+            index=chapter.index,
+            title=chapter.title,
+            volume=chapter.volume,
+        )
+        cls.write(manga, [(chapter, pages)], out, title, paths())
+
+        return chapter, out
+
+    @classmethod
+    def _convert_merged(
+        cls,
+        manga: Manga,
+        chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]],
+        out: Path,
+    ):
+        """Convert a series of chapters into a single archive, storing their
+        pages"""
+
+        paths = (path for _, _, _, path in cls.stream(chapters))
+        cls.write(manga, chapters, out, out.stem, paths)
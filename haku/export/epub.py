@@ -0,0 +1,204 @@
+from datetime import datetime, timezone
+from html import escape
+from pathlib import Path
+from typing import Dict, List, Tuple
+from zipfile import ZIP_STORED, ZipFile
+
+from PIL import Image
+
+from haku.export import Converter
+from haku.meta import Chapter, Manga, Page
+
+
+class Epub(Converter):
+    """Epub converter.
+
+    Pages are stored in a fixed layout epub as they are, without compression,
+    each one wrapped in its own xhtml page. Chapters are listed in the table
+    of contents
+    """
+
+    EXT: str = "epub"
+    FMT_PAGE: str = "{number:04d}"
+    FMT_TOC: str = "{index:g} {title}"
+
+    MEDIA_TYPES: Dict[str, str] = {
+        ".jpg": "image/jpeg",
+        ".jpeg": "image/jpeg",
+        ".png": "image/png",
+        ".gif": "image/gif",
+        ".webp": "image/webp",
+    }
+
+    CONTAINER: str = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<container version="1.0" '
+        'xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+        "<rootfiles>"
+        '<rootfile full-path="OEBPS/content.opf" '
+        'media-type="application/oebps-package+xml"/>'
+        "</rootfiles>"
+        "</container>"
+    )
+
+    PAGE: str = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<!DOCTYPE html>\n"
+        '<html xmlns="http://www.w3.org/1999/xhtml">'
+        "<head>"
+        "<title>{title}</title>"
+        '<meta name="viewport" content="width={width}, height={height}"/>'
+        "</head>"
+        '<body style="margin: 0">'
+        '<img src="../images/{image}" alt="" style="width: 100%; height: 100%"/>'
+        "</body>"
+        "</html>"
+    )
+
+    @classmethod
+    def toc(cls, title: str, entries: List[Tuple[str, str]]) -> str:
+        """Build the navigation document, given `(label, href)` entries"""
+
+        items = "".join(
+            f'<li><a href="{href}">{escape(label)}</a></li>' for label, href in entries
+        )
+
+        return (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            "<!DOCTYPE html>\n"
+            '<html xmlns="http://www.w3.org/1999/xhtml" '
+            'xmlns:epub="http://www.idpf.org/2007/ops">'
+            f"<head><title>{escape(title)}</title></head>"
+            f'<body><nav epub:type="toc"><ol>{items}</ol></nav></body>'
+            "</html>"
+        )
+
+    @classmethod
+    def package(
+        cls, manga: Manga, title: str, pages: List[Tuple[str, str, str]]
+    ) -> str:
+        """Build the package document, given `(page name, image name, media
+        type)` for each page"""
+
+        modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        manifest = [
+            '<item id="nav" href="nav.xhtml" '
+            'media-type="application/xhtml+xml" properties="nav"/>'
+        ]
+        spine = []
+        for i, (page, image, media_type) in enumerate(pages):
+            manifest.append(
+                f'<item id="p{i}" href="pages/{page}.xhtml" '
+                'media-type="application/xhtml+xml"/>'
+            )
+            manifest.append(
+                f'<item id="i{i}" href="images/{image}" media-type="{media_type}"/>'
+            )
+            spine.append(f'<itemref idref="p{i}"/>')
+
+        return (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" '
+            'unique-identifier="id" prefix="rendition: '
+            'http://www.idpf.org/vocab/rendition/#">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="id">{escape(f"{manga.url}#{title}")}</dc:identifier>'
+            f"<dc:title>{escape(title)}</dc:title>"
+            "<dc:language>und</dc:language>"
+            f'<meta property="dcterms:modified">{modified}</meta>'
+            '<meta property="rendition:layout">pre-paginated</meta>'
+            "</metadata>"
+            f"<manifest>{''.join(manifest)}</manifest>"
+            f"<spine>{''.join(spine)}</spine>"
+            "</package>"
+        )
+
+    @classmethod
+    def write(
+        cls,
+        manga: Manga,
+        chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]],
+        out: Path,
+        title: str,
+        events: bool = True,
+    ):
+        """Write a series of chapters into a single epub.
+        If `events`, chapter events are emitted too"""
+
+        pages, toc = [], []
+
+        with ZipFile(out, "w", compression=ZIP_STORED) as archive:
+            # the mimetype must come first
+            archive.writestr("mimetype", "application/epub+zip")
+            archive.writestr("META-INF/container.xml", cls.CONTAINER)
+
+            for chapter, pages_chapter in chapters:
+                if events:
+                    cls.emit("chapter", chapter)
+
+                for i, (page, path) in enumerate(pages_chapter):
+                    name = cls.FMT_PAGE.format(number=len(pages))
+                    image = f"{name}{path.suffix.lower()}"
+
+                    # only the header is read to get the size
+                    with Image.open(path) as decoded:
+                        width, height = decoded.size
+
+                    archive.write(path, f"OEBPS/images/{image}")
+                    xhtml = cls.PAGE.format(
+                        title=escape(title), width=width, height=height, image=image
+                    )
+                    archive.writestr(f"OEBPS/pages/{name}.xhtml", xhtml)
+
+                    media_type = cls.MEDIA_TYPES.get(path.suffix.lower(), "image/png")
+                    pages.append((name, image, media_type))
+
+                    if i == 0:
+                        label = cls.FMT_TOC.format(
+                            index=chapter.index,
+                            title=chapter.title,
+                            volume=chapter.volume,
+                        )
+                        toc.append((label, f"pages/{name}.xhtml"))
+
+                    cls.emit(cls.endkey("page"), page)
+
+                if events:
+                    cls.emit(cls.endkey("chapter"), chapter)
+
+            archive.writestr("OEBPS/nav.xhtml", cls.toc(title, toc))
+            archive.writestr("OEBPS/content.opf", cls.package(manga, title, pages))
+
+    @classmethod
+    def _convert_chapter(
+        cls,
+        manga: Manga,
+        chapter: Chapter,
+        pages: List[Tuple[Page, Path]],
+        out: Path,
+    ) -> Tuple[Chapter, Path]:
+        """Convert a chapter, storing its pages"""
+
+        title = cls.FMT_CHAPTER.format(
+            index=chapter.index,
+            title=chapter.title,
+            volume=chapter.volume,
+        )
+
+        # chapter events are dispatched by the converter
+        cls.write(manga, [(chapter, pages)], out, title, events=False)
+
+        return chapter, out
+
+    @classmethod
+    def _convert_merged(
+        cls,
+        manga: Manga,
+        chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]],
+        out: Path,
+    ):
+        """Convert a series of chapters into a single epub, storing their
+        pages"""
+
+        cls.write(manga, chapters, out, out.stem)
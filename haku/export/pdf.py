@@ -1,11 +1,12 @@
 from pathlib import Path
 from typing import Any, List, Tuple
 
-from PIL import Image, ImageFile
+from PIL import ImageFile
 from PyPDF2 import PdfFileMerger, PdfFileReader
 
 from haku.export import Converter
-from haku.meta import Chapter, Page
+from haku.meta import Chapter, Manga, Page
+from haku.utils.pdf import PdfWriter
 
 # fix truncated images error
 # https://stackoverflow.com/questions/12984426/python-pil-ioerror-image-file-truncated-with-big-images
@@ -15,26 +16,47 @@ ImageFile.LOAD_TRUNCATED_IMAGES = True
 class Pdf(Converter):
     """Pdf converter"""
 
+    EXT: str = "pdf"
+    DPI: float = 100.0
+    FMT_BOOKMARK: str = "{index:g} {title}"
+
+    @classmethod
     def _convert_chapter(
-        self,
+        cls,
+        manga: Manga,
         chapter: Chapter,
-        pages: List[Tuple[Page, Image.Image]],
-    ) -> bool:
-        """Convert a chapter"""
+        pages: List[Tuple[Page, Path]],
+        out: Path,
+    ) -> Tuple[Chapter, Path]:
+        """Convert a chapter, streaming its pages"""
 
-        images = [image for _, image in pages]
-        out = self.out.chapter(chapter, fmt="{index:g} {title}.pdf")
+        with out.open("wb") as stream, PdfWriter(stream, cls.DPI) as writer:
+            for page, path in pages:
+                writer.add_page(path)
+                cls.emit(cls.endkey("page"), page)
 
-        with out.open("wb") as stream:
-            images[0].save(
-                stream,
-                format="pdf",
-                save_all=True,
-                append_images=images[1:],
-                resolution=100.0,
-            )
-
-        return True, (chapter, out)
+        return chapter, out
+
+    @classmethod
+    def _convert_merged(
+        cls,
+        manga: Manga,
+        chapters: List[Tuple[Chapter, List[Tuple[Page, Path]]]],
+        out: Path,
+    ):
+        """Convert a series of chapters into a single pdf, streaming their
+        pages, with a bookmark for each chapter"""
+
+        with out.open("wb") as stream, PdfWriter(stream, cls.DPI) as writer:
+            for chapter, i, _, path in cls.stream(chapters):
+                number = writer.add_page(path)
+                if i == 0:
+                    title = cls.FMT_BOOKMARK.format(
+                        index=chapter.index,
+                        title=chapter.title,
+                        volume=chapter.volume,
+                    )
+                    writer.bookmark(title, number)
 
     def _merge(self, chapters: List[Tuple[Chapter, Any]], out: Path, name: str):
 
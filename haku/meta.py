@@ -1,20 +1,30 @@
-from dataclasses import asdict, dataclass
-from typing import Dict, List, Optional
+import os
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass, fields
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, Optional, Union
 
 import yaml
 
+# use libyaml bindings when available
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
 
 @dataclass
 class Page:
     """Page meta"""
 
+    __slots__ = ("url", "index")
+
     url: int
     index: str
 
     def as_dict(self) -> Dict:
         """Serialize into a `dict`"""
 
-        return asdict(self)
+        return {"url": self.url, "index": self.index}
 
     @staticmethod
     def from_dict(src: Dict):
@@ -23,43 +33,170 @@ class Page:
         return Page(url=src["url"], index=src["index"])
 
 
-@dataclass
+class Pages(Sequence):
+    """Columnar table of the pages of a chapter.
+
+    Urls are stored once as a shared prefix plus a single string holding
+    all the suffixes, and integer indices are packed in an array. `Page`
+    objects are built on access
+    """
+
+    __slots__ = ("prefix", "suffixes", "ends", "indices")
+
+    def __init__(self, urls: List[str], indices: List[Any]):
+        self.prefix = os.path.commonprefix(urls) if len(urls) > 1 else ""
+        suffixes = [url[len(self.prefix) :] for url in urls]
+
+        self.suffixes = "".join(suffixes)
+        self.ends = array("L", accumulate(map(len, suffixes)))
+        self.indices = (
+            array("q", indices)
+            if all(type(index) is int for index in indices)
+            else tuple(indices)
+        )
+
+    @staticmethod
+    def from_pages(pages: Iterable[Page]) -> "Pages":
+        """Build a table from Page objects"""
+
+        if isinstance(pages, Pages):
+            return pages
+
+        pages = list(pages)
+        return Pages([page.url for page in pages], [page.index for page in pages])
+
+    @staticmethod
+    def from_dicts(src: List[Dict]) -> "Pages":
+        """Build a table from serialized pages"""
+
+        return Pages([page["url"] for page in src], [page["index"] for page in src])
+
+    def url(self, i: int) -> str:
+        """Get the url of the `i`-th page"""
+
+        start = self.ends[i - 1] if i > 0 else 0
+        return self.prefix + self.suffixes[start : self.ends[i]]
+
+    def as_dicts(self) -> List[Dict]:
+        """Serialize into a list of `dict`"""
+
+        return [
+            {"url": self.url(i), "index": index} for i, index in enumerate(self.indices)
+        ]
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Page, List[Page]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("page index out of range")
+
+        return Page(url=self.url(i), index=self.indices[i])
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
 class Chapter:
-    """Chapter meta"""
+    """Chapter meta.
+    Pages are stored in a `Pages` table, whatever the sequence they are
+    assigned from"""
 
-    url: str
-    title: str
-    index: float
+    __slots__ = ("url", "title", "index", "volume", "_pages", "_raw_pages")
 
-    volume: Optional[float] = None
-    pages: Optional[List[Page]] = None
+    def __init__(
+        self,
+        url: str,
+        title: str,
+        index: float,
+        volume: Optional[float] = None,
+        pages: Optional[Iterable[Page]] = None,
+    ):
+        self.url = url
+        self.title = title
+        self.index = index
+        self.volume = volume
+        self.pages = pages
+
+    @property
+    def pages(self) -> Optional[Pages]:
+        """Get the pages, parsing them if still serialized"""
+
+        if self._raw_pages is not None:
+            self._pages = Pages.from_dicts(self._raw_pages)
+            self._raw_pages = None
+
+        return self._pages
+
+    @pages.setter
+    def pages(self, pages: Optional[Iterable[Page]]):
+        self._pages = Pages.from_pages(pages) if pages is not None else None
+        self._raw_pages = None
 
     def as_dict(self, add_pages: bool = True) -> Dict:
         """Serialize into a `dict`"""
 
-        dictified = asdict(self)
+        dictified = {
+            "url": self.url,
+            "title": self.title,
+            "index": self.index,
+            "volume": self.volume,
+        }
 
-        if not add_pages:
-            del dictified["pages"]
+        if add_pages:
+            dictified["pages"] = (
+                self.pages.as_dicts() if self.pages is not None else None
+            )
 
         return dictified
 
     @staticmethod
-    def from_dict(src: Dict):
-        """Parse a dict into a Chapter object"""
+    def from_dict(src: Dict, lazy: bool = False):
+        """Parse a dict into a Chapter object.
+        If `lazy`, pages are parsed on first access"""
 
-        pages = (
-            list(map(Page.from_dict, src["pages"]))
-            if src["pages"] is not None
-            else None
-        )
-
-        return Chapter(
+        chapter = Chapter(
             url=src["url"],
             title=src["title"],
             index=src["index"],
             volume=src["volume"],
-            pages=pages,
+        )
+
+        if src["pages"] is not None:
+            if lazy:
+                chapter._raw_pages = src["pages"]
+            else:
+                chapter._pages = Pages.from_dicts(src["pages"])
+
+        return chapter
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Chapter):
+            return NotImplemented
+
+        return (self.url, self.title, self.index, self.volume, self.pages) == (
+            other.url,
+            other.title,
+            other.index,
+            other.volume,
+            other.pages,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Chapter(url={self.url!r}, title={self.title!r}, index={self.index!r}, "
+            f"volume={self.volume!r}, pages={self.pages!r})"
         )
 
 
@@ -76,12 +213,14 @@ class Manga:
     def as_dict(self, add_chapters: bool = True, add_pages: bool = True) -> Dict:
         """Serialize into a `dict`"""
 
-        dictified = asdict(self)
+        dictified = {
+            field.name: getattr(self, field.name)
+            for field in fields(self)
+            if field.name != "chapters"
+        }
 
         if add_chapters:
             dictified["chapters"] = [c.as_dict(add_pages) for c in self.chapters]
-        else:
-            del dictified["chapters"]
 
         return dictified
 
@@ -93,14 +232,15 @@ class Manga:
         """Serialize as json"""
 
         dictified = self.as_dict(add_chapters, add_pages)
-        return yaml.dump(dictified)
+        return yaml.dump(dictified, Dumper=YamlDumper)
 
     @staticmethod
-    def from_dict(src: Dict):
-        """Parse a dict into a Manga object"""
+    def from_dict(src: Dict, lazy: bool = False):
+        """Parse a dict into a Manga object.
+        If `lazy`, the pages of each chapter are parsed on first access"""
 
         chapters = (
-            list(map(Chapter.from_dict, src["chapters"]))
+            [Chapter.from_dict(chapter, lazy) for chapter in src["chapters"]]
             if src["chapters"] is not None
             else None
         )
@@ -116,5 +256,5 @@ class Manga:
     def from_yaml(src: str):
         """Parse a yaml string into a Manga object"""
 
-        dictified = yaml.safe_load(src)
+        dictified = yaml.load(src, Loader=YamlLoader)
         return Manga.from_dict(dictified)
@@ -1,27 +1,98 @@
 import asyncio
 import re
+from functools import partial
 from importlib import import_module
+from importlib.util import find_spec
 from io import BytesIO
-from typing import List, Optional, Type
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
 
 import aiohttp
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from PIL import Image
 
 from haku.exceptions import NoProviderFound
 from haku.meta import Chapter, Manga, Page
 from haku.providers import providers
 from haku.raw.endpoints import Endpoints
+from haku.raw.engine import Engine
 from haku.shelf import Filter, Shelf
 from haku.utils import abstract, eventh
+from haku.utils.cache import Cache, HttpCache, HttpEntry
 
 
 class Helpers:
-    """Provider helpers"""
+    """Provider helpers.
 
-    def __init__(self):
-        self.cached_webpages = {}
-        self.cached_soups = {}
+    Webpages and soups are kept in bounded LRU caches. The size of a soup is
+    estimated as `SOUP_SIZE_FACTOR` times the size of its source.
+    Webpages are also stored in the persistent `http_cache`, and revalidated
+    with conditional requests.
+    Soups are cooked off the event loop, with `lxml` when available.
+    Concurrent requests of the same webpage or soup share a single fetch
+    """
+
+    SOUP_SIZE_FACTOR: int = 10
+    PARSER: str = "lxml" if find_spec("lxml") is not None else "html.parser"
+
+    def __init__(
+        self,
+        cached_webpages: Optional[Cache] = None,
+        cached_soups: Optional[Cache] = None,
+        http_cache: Optional[HttpCache] = None,
+    ):
+        if cached_webpages is None:
+            cached_webpages = Cache(max_bytes=64 * 2**20, sizeof=len)
+
+        if cached_soups is None:
+            cached_soups = Cache(max_items=32, max_bytes=256 * 2**20)
+
+        self.cached_webpages = cached_webpages
+        self.cached_soups = cached_soups
+        self.http_cache = http_cache or HttpCache()
+        self.pending: Dict[Hashable, asyncio.Future] = {}
+
+    async def once(self, key: Hashable, cbk: Callable[[], Awaitable]) -> Any:
+        """Run `cbk` once for concurrent callers with the same `key`: callers
+        arriving while it is still pending wait for the same result"""
+
+        if key not in self.pending:
+            future = asyncio.ensure_future(cbk())
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+            self.pending[key] = future
+
+        return await asyncio.shield(self.pending[key])
+
+    @staticmethod
+    def strainer(*classes: str) -> SoupStrainer:
+        """Build a strainer parsing only the tags with one of `classes`"""
+
+        classes = set(classes)
+
+        def match(value) -> bool:
+            if value is None:
+                return False
+
+            values = value.split() if isinstance(value, str) else value
+            return not classes.isdisjoint(values)
+
+        return SoupStrainer(class_=match)
+
+    def forget(self, url: str):
+        """Drop the cached webpage and soup of `url`"""
+
+        self.cached_webpages.pop(url)
+        self.cached_soups.pop(url)
 
     async def scrape(
         self, session: aiohttp.ClientSession, url: str, allow_cached=True
@@ -29,29 +100,73 @@ class Helpers:
         """Scrape a webpage"""
 
         if url in self.cached_webpages and allow_cached:
-            print(f"Using cached {url}")
             return self.cached_webpages[url]
 
-        async with session.get(url) as response:
-            content = await response.text()
+        return await self.once(("webpage", url), lambda: self._scrape(session, url))
+
+    async def _scrape(self, session: aiohttp.ClientSession, url: str) -> str:
+        """Scrape a webpage, revalidating it against the http cache"""
+
+        entry = self.http_cache.get(url)
+        headers = HttpCache.validators(entry)
+
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                content = entry.body
+            else:
+                content = await response.text()
+                self.store(url, content, response)
+
             self.cached_webpages[url] = content
             return content
 
+    def store(self, url: str, content: str, response: aiohttp.ClientResponse):
+        """Store a response in the http cache, if it can be revalidated"""
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        if response.status == 200 and (etag or last_modified):
+            self.http_cache.set(url, HttpEntry(content, etag, last_modified))
+
     async def scrape_and_cook(
         self,
         session: aiohttp.ClientSession,
         url: str,
         allow_cached=True,
-        parser="html.parser",
+        parser: Optional[str] = None,
+        parse_only: Optional[SoupStrainer] = None,
     ) -> BeautifulSoup:
-        """Scrape a webpage into a BeautifulSoup soup"""
+        """Scrape a webpage into a BeautifulSoup soup.
+        If `parse_only` is given, only the matching parts are parsed"""
+
+        cached = self.cached_soups.get(url)
+        if allow_cached and cached is not None and cached[0] is parse_only:
+            return cached[1]
+
+        return await self.once(
+            ("soup", url, parse_only),
+            lambda: self._cook(session, url, allow_cached, parser, parse_only),
+        )
 
-        if url in self.cached_soups and allow_cached:
-            return self.cached_soups[url]
+    async def _cook(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        allow_cached: bool,
+        parser: Optional[str],
+        parse_only: Optional[SoupStrainer],
+    ) -> BeautifulSoup:
+        """Scrape and parse a webpage, caching the soup"""
 
         content = await self.scrape(session, url, allow_cached=allow_cached)
-        soup = BeautifulSoup(content, parser)
-        self.cached_soups[url] = soup
+        cook = partial(
+            BeautifulSoup, content, parser or self.PARSER, parse_only=parse_only
+        )
+        soup = await asyncio.get_running_loop().run_in_executor(None, cook)
+
+        size = len(content) * self.SOUP_SIZE_FACTOR
+        self.cached_soups.set(url, (parse_only, soup), size=size)
         return soup
 
     async def fetch_image(self, session: aiohttp.ClientSession, url: str) -> Image:
@@ -121,39 +236,104 @@ class Scraper(eventh.Handler):
         self,
         f: Optional[Filter] = None,
         fetch_pages: bool = True,
+        engine: Optional[Engine] = None,
     ) -> Shelf:
-        """Fetch the manga"""
+        """Fetch the manga, using the connection pool of `engine`"""
 
-        return asyncio.run(self.fetch(f, fetch_pages))
+        with Engine.borrow(engine) as engine:
+            return engine.run(lambda session: self.fetch(f, fetch_pages, session))
 
     async def fetch(
         self,
         f: Optional[Filter] = None,
         fetch_pages: bool = True,
+        session: Optional[aiohttp.ClientSession] = None,
     ) -> Shelf:
         """Fetch the manga"""
 
-        async with aiohttp.ClientSession() as session:
-
-            manga = Manga(
-                title=await self.fetch_title(session, self.url),
-                cover=await self.fetch_cover(session, self.url),
-                chapters=await self.fetch_chapters(session, self.url),
-                url=self.url,
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.fetch(f, fetch_pages, session)
+
+        title, cover, chapters = await asyncio.gather(
+            self.fetch_title(session, self.url),
+            self.fetch_cover(session, self.url),
+            self.fetch_chapters(session, self.url),
+        )
+        manga = Manga(title=title, cover=cover, chapters=chapters, url=self.url)
+
+        shelf = Shelf(manga)
+        if f is not None:
+            shelf.filter(f)
+
+        if fetch_pages:
+            pages_futures = (
+                asyncio.ensure_future(self.fetch_pages(session, chapter))
+                for chapter in shelf.manga.chapters
             )
+            await asyncio.gather(*pages_futures)
 
-            shelf = Shelf(manga)
-            if f is not None:
-                shelf.filter(f)
+        return shelf
 
-            if fetch_pages:
-                pages_futures = (
-                    asyncio.ensure_future(self.fetch_pages(session, chapter))
-                    for chapter in shelf.manga.chapters
+    def fetch_incremental_sync(
+        self,
+        previous: Manga,
+        f: Optional[Filter] = None,
+        fetch_pages: bool = True,
+        engine: Optional[Engine] = None,
+    ) -> Tuple[Shelf, List[Chapter]]:
+        """Fetch the manga incrementally, using the connection pool of `engine`"""
+
+        with Engine.borrow(engine) as engine:
+            return engine.run(
+                lambda session: self.fetch_incremental(
+                    previous, f, fetch_pages, session
                 )
-                await asyncio.gather(*pages_futures)
+            )
 
-            return shelf
+    async def fetch_incremental(
+        self,
+        previous: Manga,
+        f: Optional[Filter] = None,
+        fetch_pages: bool = True,
+        session: Optional[aiohttp.ClientSession] = None,
+    ) -> Tuple[Shelf, List[Chapter]]:
+        """Fetch the manga, retrieving the pages only of the chapters new or
+        changed since `previous`. Returns the shelf and the changed chapters"""
+
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.fetch_incremental(previous, f, fetch_pages, session)
+
+        shelf = await self.fetch(f, fetch_pages=False, session=session)
+        changed = shelf.reuse_pages(previous)
+
+        if fetch_pages:
+            pages_futures = (
+                asyncio.ensure_future(self.fetch_pages(session, chapter))
+                for chapter in changed
+            )
+            await asyncio.gather(*pages_futures)
+
+        return shelf, changed
+
+    async def stream_pages(
+        self, session: aiohttp.ClientSession, chapters: List[Chapter]
+    ) -> AsyncIterator[Chapter]:
+        """Retrieve pages lists, yielding each chapter as soon as its pages
+        are ready"""
+
+        futures = [
+            asyncio.ensure_future(self.fetch_pages(session, chapter))
+            for chapter in chapters
+        ]
+
+        try:
+            for future in asyncio.as_completed(futures):
+                yield await future
+        finally:
+            for future in futures:
+                future.cancel()
 
     @eventh.Handler.event("title", wrap_async=True)
     async def fetch_title(self, session: aiohttp.ClientSession, url: str) -> str:
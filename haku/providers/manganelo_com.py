@@ -4,7 +4,7 @@ from typing import Dict, List
 import aiohttp
 
 from haku.meta import Chapter, Page
-from haku.provider import Provider
+from haku.provider import Helpers, Provider
 from haku.raw.endpoints import Endpoints
 
 # TODO(me) switch images server
@@ -37,18 +37,28 @@ class ManganeloCom(Provider):
         r"(?:Vol.(?P<volume>(.*)) )?Chapter (?P<index>[^\n:]*)(?:: *(?P<title>.*))?"
     )
 
+    # parts of the webpages actually parsed
+    series_parts = Helpers.strainer("story-info-right", "info-image", "chapter-name")
+    chapter_parts = Helpers.strainer("container-chapter-reader")
+
     async def fetch_cover(self, session: aiohttp.ClientSession, url: str):
-        page = await self.helpers.scrape_and_cook(session, url)
+        page = await self.helpers.scrape_and_cook(
+            session, url, parse_only=self.series_parts
+        )
         return page.select("span.info-image img")[0]["src"]
 
     async def fetch_title(self, session: aiohttp.ClientSession, url: str):
-        page = await self.helpers.scrape_and_cook(session, url)
+        page = await self.helpers.scrape_and_cook(
+            session, url, parse_only=self.series_parts
+        )
         return page.select("div.story-info-right h1")[0].text
 
     async def fetch_chapters(
         self, session: aiohttp.ClientSession, url: str
     ) -> List[Chapter]:
-        page = await self.helpers.scrape_and_cook(session, url)
+        page = await self.helpers.scrape_and_cook(
+            session, url, parse_only=self.series_parts
+        )
 
         chapters = []
         for chapter in page.select("a.chapter-name"):
@@ -68,7 +78,9 @@ class ManganeloCom(Provider):
     async def fetch_pages(
         self, session: aiohttp.ClientSession, chapter: Chapter
     ) -> List[Page]:
-        page = await self.helpers.scrape_and_cook(session, chapter.url)
+        page = await self.helpers.scrape_and_cook(
+            session, chapter.url, parse_only=self.chapter_parts
+        )
 
         pages = []
         for image in page.select("div.container-chapter-reader img"):
@@ -79,6 +91,8 @@ class ManganeloCom(Provider):
 
             self.endpoints._chapters_refs[url] = chapter.url
 
+        # chapter pages are never scraped twice
+        self.helpers.forget(chapter.url)
         return pages
 
 
@@ -1,13 +1,16 @@
 import asyncio
 from pathlib import Path
-from typing import Callable, Optional, Union
+from typing import AsyncIterable, Callable, Generator, List, Optional, Tuple, Union
 
 import aiohttp
 
 from haku.meta import Manga, Page
 from haku.provider import Scraper
-from haku.raw.endpoints import Endpoints
-from haku.raw.fs import FTree
+from haku.raw.endpoints import Endpoints, Limiter
+from haku.raw.engine import Engine
+from haku.raw.fs import FTree, Reader
+from haku.raw.retry import RetryPolicy
+from haku.raw.transcoder import Transcoder
 from haku.shelf import Shelf
 from haku.utils import chunks, tmpdir
 
@@ -16,19 +19,135 @@ class Method:
     """Download methods"""
 
     @staticmethod
-    def batch(size: int = 0) -> Callable[[Endpoints, FTree, Manga], None]:
-        """Download chapters in chunk"""
+    def pages(tree: FTree, manga: Manga) -> Generator[Tuple[Page, Path], None, None]:
+        """Lazily list the pages to download, cover included"""
+
+        yield from tree.flatten(*manga.chapters)
+        if manga.cover is not None and manga.cover != "":
+            cover = Page(url=manga.cover, index="cover")
+            yield cover, tree.cover()
 
-        async def method(endpoints: Endpoints, tree: FTree, manga: Manga):
-            pages = list(tree.flatten(*manga.chapters))
-            if manga.cover is not None and manga.cover != "":
-                cover = Page(url=manga.cover, index="cover")
-                pages.append((cover, tree.cover()))
+    @staticmethod
+    def batch(
+        size: int = 0,
+    ) -> Callable[[Endpoints, aiohttp.ClientSession, FTree, Manga], None]:
+        """Download chapters in chunk"""
 
+        async def method(
+            endpoints: Endpoints,
+            session: aiohttp.ClientSession,
+            tree: FTree,
+            manga: Manga,
+        ):
+            pages = list(Method.pages(tree, manga))
             actual_size = len(pages) if size == 0 else size
             for chunk in chunks(pages, actual_size):
-                async with aiohttp.ClientSession() as session:
-                    await endpoints.pages(session, *chunk)
+                await endpoints.pages(session, *chunk)
+
+        return method
+
+    @staticmethod
+    async def drain(
+        endpoints: Endpoints,
+        session: aiohttp.ClientSession,
+        pages: AsyncIterable[Tuple[Page, Path]],
+        workers: int,
+        size: Optional[int] = None,
+    ):
+        """Download `pages` with a fixed pool of `workers`, fed through a queue
+        holding at most `size` pages.
+        An exception escaping a worker stops the download and is re-raised"""
+
+        queue = asyncio.Queue(maxsize=size or 2 * workers)
+
+        async def worker():
+            while True:
+                page, path = await queue.get()
+                try:
+                    await endpoints.page(session, page, path)
+                finally:
+                    queue.task_done()
+
+        async def feed():
+            async for page, path in pages:
+                await queue.put((page, path))
+            await queue.join()
+
+        # workers never return, so they complete only by raising
+        tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+        feeder = asyncio.ensure_future(feed())
+        try:
+            done, _ = await asyncio.wait(
+                [feeder, *tasks], return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+        finally:
+            for task in (feeder, *tasks):
+                task.cancel()
+            await asyncio.gather(feeder, *tasks, return_exceptions=True)
+
+    @staticmethod
+    def stream(
+        workers: int = 100,
+        size: Optional[int] = None,
+    ) -> Callable[[Endpoints, aiohttp.ClientSession, FTree, Manga], None]:
+        """Download pages with a fixed pool of `workers`, fed lazily through
+        a queue holding at most `size` pages"""
+
+        async def method(
+            endpoints: Endpoints,
+            session: aiohttp.ClientSession,
+            tree: FTree,
+            manga: Manga,
+        ):
+            async def pages():
+                for page, path in Method.pages(tree, manga):
+                    yield page, path
+
+            await Method.drain(endpoints, session, pages(), workers, size)
+
+        return method
+
+    @staticmethod
+    def pipeline(
+        scraper: Scraper,
+        workers: int = 100,
+        size: Optional[int] = None,
+    ) -> Callable[[Endpoints, aiohttp.ClientSession, FTree, Manga], None]:
+        """Download pages while chapters are still being fetched: the pages of
+        a chapter are queued as soon as `scraper` retrieves them.
+        Chapters that already have pages are not fetched again, and pages
+        already on disk are skipped. Each chapter dispatches a `pages.queued`
+        event on the endpoints"""
+
+        async def method(
+            endpoints: Endpoints,
+            session: aiohttp.ClientSession,
+            tree: FTree,
+            manga: Manga,
+        ):
+            reader = Reader(tree)
+            ready = [chapter for chapter in manga.chapters if chapter.pages is not None]
+            to_fetch = [chapter for chapter in manga.chapters if chapter.pages is None]
+
+            async def chapters():
+                for chapter in ready:
+                    yield chapter
+                async for chapter in scraper.stream_pages(session, to_fetch):
+                    yield chapter
+
+            async def pages():
+                if manga.cover is not None and manga.cover != "":
+                    yield Page(url=manga.cover, index="cover"), tree.cover()
+
+                async for chapter in chapters():
+                    missing = reader.missing_chapter(chapter)
+                    endpoints.dispatch("pages.queued", chapter, missing.pages)
+                    for page, path in tree.flatten(missing):
+                        yield page, path
+
+            await Method.drain(endpoints, session, pages(), workers, size)
 
         return method
 
@@ -49,22 +168,120 @@ class Downloader:
         )
         self.manga = manga if isinstance(manga, Manga) else manga.manga
         self.tree = root if isinstance(root, FTree) else FTree(root, self.manga)
+        self.endpoints.passthrough = self.tree.passthrough
 
     def download(
         self,
-        method: Callable = Method.batch(),
-        rate_limit: int = 200,
+        method: Callable = Method.stream(),
+        rate_limit: float = 0,
+        concurrency: int = 8,
         setup_recovery_plan: bool = True,
+        engine: Optional[Engine] = None,
+        transcoder: Optional[Transcoder] = None,
+        retry: Optional[RetryPolicy] = None,
     ) -> FTree:
-        """Download the manga with the given method"""
+        """Download the manga with the given method.
+
+        `concurrency` caps the requests in flight for each host, while
+        `rate_limit` caps the requests per second for each host (`0` to disable).
+        The whole download runs on a single session of `engine`, and pages are
+        transcoded on the worker pool of `transcoder`. Pages failing after the
+        attempts allowed by `retry` are recorded in the recovery plan
+        """
+
+        self.setup(
+            Limiter(concurrency, rate_limit),
+            transcoder or self.endpoints.transcoder,
+            retry or self.endpoints.retry,
+            setup_recovery_plan,
+        )
+
+        with Engine.borrow(engine) as engine, self.endpoints.transcoder:
+            engine.run(
+                lambda session: method(self.endpoints, session, self.tree, self.manga)
+            )
+
+        return self.teardown(setup_recovery_plan)
+
+    def setup(
+        self,
+        limiter: Limiter,
+        transcoder: Transcoder,
+        retry: RetryPolicy,
+        setup_recovery_plan: bool = True,
+    ):
+        """Prepare the endpoints and the recovery plan for a download"""
 
         if setup_recovery_plan:
             self.tree.dotman.dump(self.manga)
 
-        async def runner():
-            async with asyncio.Semaphore(rate_limit):
-                await method(self.endpoints, self.tree, self.manga)
+        self.endpoints.limiter = limiter
+        self.endpoints.transcoder = transcoder
+        self.endpoints.retry = retry
+        self.endpoints.failed = []
+        self.endpoints.manifest = self.tree.manifest
+
+    def teardown(self, setup_recovery_plan: bool = True) -> FTree:
+        """Record the failed pages in the recovery plan after a download"""
 
-        asyncio.run(runner())
+        self.tree.manifest.close()
+        if setup_recovery_plan:
+            self.tree.dotman.dump(self.manga, failed=self.endpoints.failed)
 
         return self.tree
+
+
+class Batch:
+    """Download many series at once.
+
+    All the series run on a single event loop and connection pool, and share
+    the same per host limiter: requests to a host are served in turns, so
+    every series gets its share of the bandwidth. Errors of a series don't
+    stop the others, and are collected in `errors`
+    """
+
+    def __init__(self):
+        self.jobs: List[Tuple[Downloader, Callable]] = []
+        self.errors: List[Tuple[Downloader, Exception]] = []
+
+    def add(self, downloader: Downloader, method: Callable = Method.stream()):
+        """Add a series to the batch, downloaded with the given method"""
+
+        self.jobs.append((downloader, method))
+        return self
+
+    def download(
+        self,
+        rate_limit: float = 0,
+        concurrency: int = 8,
+        setup_recovery_plan: bool = True,
+        engine: Optional[Engine] = None,
+        transcoder: Optional[Transcoder] = None,
+        retry: Optional[RetryPolicy] = None,
+    ) -> List[FTree]:
+        """Download all the series, see `Downloader.download`"""
+
+        limiter = Limiter(concurrency, rate_limit)
+        transcoder = transcoder or Transcoder()
+        retry = retry or RetryPolicy()
+
+        for downloader, _ in self.jobs:
+            downloader.setup(limiter, transcoder, retry, setup_recovery_plan)
+
+        async def runner(session: aiohttp.ClientSession):
+            tasks = (
+                method(downloader.endpoints, session, downloader.tree, downloader.manga)
+                for downloader, method in self.jobs
+            )
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        with Engine.borrow(engine) as engine, transcoder:
+            results = engine.run(runner)
+
+        self.errors = [
+            (downloader, result)
+            for (downloader, _), result in zip(self.jobs, results)
+            if isinstance(result, Exception)
+        ]
+
+        return [downloader.teardown(setup_recovery_plan) for downloader, _ in self.jobs]
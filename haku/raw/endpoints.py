@@ -1,55 +1,278 @@
 import asyncio
+import os
 import ssl
-from io import BytesIO
+from contextlib import asynccontextmanager
+from itertools import count
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 import aiohttp
 from PIL import Image
 
+from haku.exceptions import UnexpectedResponse
 from haku.meta import Page
-from haku.utils import eventh, write_image
+from haku.raw.fs import Manifest
+from haku.raw.retry import RetryPolicy
+from haku.raw.transcoder import Transcoder
+from haku.utils import ImageInfo, eventh, hasher, partial_path, validator_path
+
+
+class Limiter:
+    """Per host concurrency and rate limiter.
+
+    Every host gets its own semaphore, allowing at most `concurrency` requests
+    in flight, and its own schedule, spacing requests by `1 / rate` seconds.
+    A `rate` of `0` disables the rate limit.
+    """
+
+    def __init__(self, concurrency: int = 8, rate: float = 0):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.slots: Dict[str, float] = {}
+
+    @staticmethod
+    def host(url: str) -> str:
+        """Get the host of an url"""
+
+        return urlparse(url).netloc
+
+    async def wait(self, host: str):
+        """Wait for the next free slot of `host`"""
+
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.slots.get(host, now))
+
+        if self.rate > 0:
+            self.slots[host] = slot + 1 / self.rate
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def defer(self, url: str, delay: float):
+        """Hold back the requests to the host of `url` for `delay` seconds"""
+
+        host = self.host(url)
+        now = asyncio.get_running_loop().time()
+        self.slots[host] = max(self.slots.get(host, now), now + delay)
+
+    @asynccontextmanager
+    async def __call__(self, url: str) -> AsyncIterator[None]:
+        """Hold a request slot for the host of `url`"""
+
+        host = self.host(url)
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.concurrency)
+
+        async with self.semaphores[host]:
+            await self.wait(host)
+            yield
 
 
 class Endpoints(eventh.Handler):
-    """Downloader endpoints"""
+    """Downloader endpoints.
+
+    Pages failing after all the attempts allowed by `retry` are collected
+    in `failed`, while the written ones are recorded in `manifest`, if any
+    """
 
     RETRY_ON_CONNECTION_ERROR: bool = True
     ALLOWED_CONNECTION_ERRORS: Tuple[Exception] = (aiohttp.ClientError, ssl.SSLError)
+    CHUNK_SIZE: int = 2**16
+
+    # extensions of the streamed pages, by their actual format
+    FORMAT_EXTS: Dict[str, str] = {
+        "JPEG": "jpg",
+        "PNG": "png",
+        "GIF": "gif",
+        "WEBP": "webp",
+        "BMP": "bmp",
+        "TIFF": "tif",
+    }
+
+    def __init__(
+        self,
+        limiter: Optional[Limiter] = None,
+        passthrough: bool = False,
+        transcoder: Optional[Transcoder] = None,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        super().__init__()
+
+        self.limiter = limiter or Limiter()
+        self.passthrough = passthrough
+        self.transcoder = transcoder or Transcoder()
+        self.retry = retry or RetryPolicy()
+        self.failed: List[Tuple[Page, Path, Exception]] = []
+        self.manifest: Optional[Manifest] = None
+
+    def get_headers(self, url: str) -> Dict[str, str]:
+        """Get custom headers"""
+
+        return {}
 
     async def get_page(
         self,
         session: aiohttp.ClientSession,
         page: Page,
         headers: Dict[str, str],
-    ) -> Image:
+    ) -> bytes:
         """Page downloader async worker"""
 
         async with session.get(page.url, headers=headers) as response:
-            raw = await response.read()
-            stream = BytesIO(raw)
-            image = Image.open(stream)
-            return image
+            if not response.ok:
+                retry_after = response.headers.get("Retry-After")
+                raise UnexpectedResponse(page.url, response.status, retry_after)
 
-    @eventh.Handler.event("page", wrap_async=True)
-    async def page(self, session: aiohttp.ClientSession, page: Page, path: Path):
-        """Download and write a page to disk"""
+            return await response.read()
+
+    async def stream_page(
+        self,
+        session: aiohttp.ClientSession,
+        page: Page,
+        headers: Dict[str, str],
+        path: Path,
+    ) -> Tuple[Path, ImageInfo]:
+        """Page downloader async worker, streaming the raw body to `path`.
+        The body is written to a partial file, renamed on completion: if a
+        partial file already exists along with the validator of its response,
+        the download resumes from its end, as long as the page is unchanged.
+        The extension of `path` is corrected to match the actual format of the
+        page. Returns the path written"""
+
+        partial = partial_path(path)
+        validator = validator_path(path)
+        offset = partial.stat().st_size if partial.is_file() else 0
+        request_headers = dict(headers)
+        if offset > 0 and validator.is_file():
+            request_headers["Range"] = f"bytes={offset}-"
+            request_headers["If-Range"] = validator.read_text()
 
+        async with session.get(page.url, headers=request_headers) as response:
+            if response.status == 416 and "Range" in request_headers:
+                # the partial file is stale, start over
+                self.discard(path)
+                return await self.stream_page(session, page, headers, path)
+
+            if not response.ok:
+                retry_after = response.headers.get("Retry-After")
+                raise UnexpectedResponse(page.url, response.status, retry_after)
+
+            self.dispatch("page.write", page)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.store_validator(response, validator)
+
+            digest = hasher()
+            if response.status == 206:
+                digest.update(partial.read_bytes())
+
+            with partial.open("ab" if response.status == 206 else "wb") as stream:
+                async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                    digest.update(chunk)
+                    stream.write(chunk)
+
+        # only the header is read, checking that the page is an actual image
         try:
-            headers = self.get_headers(page.url)
-            image = await self.get_page(session, page, headers)
+            with Image.open(partial) as image:
+                width, height = image.size
+                ext = self.FORMAT_EXTS.get(image.format)
+        except Exception:
+            self.discard(path)
+            raise
 
-        except self.ALLOWED_CONNECTION_ERRORS as err:
-            self.dispatch("page.error.allowed", page, err)
-            if self.RETRY_ON_CONNECTION_ERROR:
-                return await self.page(session, page, path)
+        written = path.with_suffix(f".{ext}") if ext is not None else path
+        os.replace(partial, written)
+        validator.unlink(missing_ok=True)
 
-        except Exception as err:
-            self.dispatch("page.error.not_allowed", page, err)
+        info = ImageInfo(written.stat().st_size, digest.hexdigest(), width, height)
+        return written, info
 
+    @staticmethod
+    def store_validator(response: aiohttp.ClientResponse, validator: Path):
+        """Store the strong etag or the last modified date of a response, to
+        resume its partial file only if the page is unchanged"""
+
+        etag = response.headers.get("ETag")
+        if etag is not None and not etag.startswith("W/"):
+            validator.write_text(etag)
+        elif "Last-Modified" in response.headers:
+            validator.write_text(response.headers["Last-Modified"])
         else:
+            validator.unlink(missing_ok=True)
+
+    @staticmethod
+    def discard(path: Path):
+        """Remove the partial file of `path` along with its validator"""
+
+        partial_path(path).unlink(missing_ok=True)
+        validator_path(path).unlink(missing_ok=True)
+
+    async def write_page(
+        self,
+        session: aiohttp.ClientSession,
+        page: Page,
+        headers: Dict[str, str],
+        path: Path,
+    ) -> Tuple[Path, ImageInfo]:
+        """Download and write a page to disk.
+        In passthrough mode the original bytes are written without decoding,
+        otherwise the page is downloaded and transcoded within a slot of the
+        transcoder. Returns the path written"""
+
+        if self.passthrough:
+            async with self.limiter(page.url):
+                return await self.stream_page(session, page, headers, path)
+
+        # the transcoder slot bounds the raw images held in memory
+        async with self.transcoder.slot():
+            async with self.limiter(page.url):
+                raw = await self.get_page(session, page, headers)
+
             self.dispatch("page.write", page)
-            write_image(image, path)
+            return path, await self.transcoder(raw, path)
+
+    def retryable(self, err: Exception) -> bool:
+        """Check if a failed page can be retried"""
+
+        if isinstance(err, UnexpectedResponse):
+            return self.retry.retry_status(err.status)
+
+        allowed = isinstance(err, self.ALLOWED_CONNECTION_ERRORS)
+        return allowed and self.RETRY_ON_CONNECTION_ERROR
+
+    @eventh.Handler.event("page", wrap_async=True)
+    async def page(self, session: aiohttp.ClientSession, page: Page, path: Path):
+        """Download and write a page to disk, retrying as allowed by the
+        retry policy"""
+
+        headers = self.get_headers(page.url)
+
+        for attempt in count(1):
+            try:
+                written, info = await self.write_page(session, page, headers, path)
+                if self.manifest is not None:
+                    self.manifest.record(written, info)
+                return info
+
+            except Exception as err:
+                error = err
+                if not self.retryable(err):
+                    self.dispatch("page.error.not_allowed", page, err)
+                    break
+
+                self.dispatch("page.error.allowed", page, err)
+                if self.retry.exhausted(attempt, err):
+                    break
+
+                delay = self.retry.delay(attempt, err)
+                if isinstance(err, UnexpectedResponse):
+                    self.limiter.defer(page.url, delay)
+
+                await asyncio.sleep(delay)
+
+        self.failed.append((page, path, error))
+        self.dispatch("page.error.failed", page, error)
 
     async def pages(self, session: aiohttp.ClientSession, *pages: Tuple[Page, Path]):
         """Download a d write pages to disk"""
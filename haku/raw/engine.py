@@ -0,0 +1,83 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+import aiohttp
+
+
+class Engine:
+    """Shared event loop and connection pool.
+
+    Keeps a single `aiohttp.ClientSession` alive across multiple synchronous
+    runs, so scraping and downloading reuse the same keep-alive connections,
+    dns cache and TLS sessions.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 8,
+        ttl_dns_cache: int = 300,
+        keepalive_timeout: float = 30,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+
+        self.loop = asyncio.new_event_loop()
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def connector(self) -> aiohttp.TCPConnector:
+        """Build the pool connector"""
+
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+
+    async def _run(self, cbk: Callable[[aiohttp.ClientSession], Awaitable]) -> Any:
+        """Run `cbk` with the shared session, opening it if needed"""
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=self.connector())
+
+        return await cbk(self.session)
+
+    def run(self, cbk: Callable[[aiohttp.ClientSession], Awaitable]) -> Any:
+        """Run `cbk` with the shared session and wait for the result"""
+
+        return self.loop.run_until_complete(self._run(cbk))
+
+    def close(self):
+        """Close the session and the event loop"""
+
+        if self.loop.is_closed():
+            return
+
+        if self.session is not None:
+            self.loop.run_until_complete(self.session.close())
+            self.session = None
+
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
+
+    @classmethod
+    @contextmanager
+    def borrow(cls, engine: Optional["Engine"] = None) -> Iterator["Engine"]:
+        """Use `engine` if given, otherwise a new engine closed on exit"""
+
+        if engine is not None:
+            yield engine
+            return
+
+        with cls() as engine:
+            yield engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -1,39 +1,239 @@
 import asyncio
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
 from pathlib import Path
-from typing import Generator, List, Optional, Tuple
+from typing import IO, Dict, Generator, List, Optional, Set, Tuple
 
+import yaml
 from PIL import Image
 
-from haku.meta import Chapter, Manga, Page
-from haku.utils import cleanup_folder, safe_path
+from haku.exceptions import InvalidDotfile, UnsupportedDotfile
+from haku.meta import Chapter, Manga, Page, YamlDumper, YamlLoader
+from haku.utils import (
+    ImageInfo,
+    cleanup_folder,
+    hasher,
+    partial_path,
+    safe_path,
+    url_ext,
+)
 
 
 class Dotman:
-    """Dotfile manager"""
+    """Dotfile manager.
 
-    def __init__(self, root: Path, name=".haku"):
+    Dotfiles are written as `yaml`, `json` or `msgpack` (if installed) along
+    with their format version, and read whatever their format
+    """
+
+    VERSION: int = 1
+    FORMATS: Tuple[str, ...] = ("yaml", "json") + (
+        ("msgpack",) if find_spec("msgpack") is not None else ()
+    )
+
+    def __init__(self, root: Path, name=".haku", fmt="yaml"):
         self.name = name
         self.root = root
+        self.fmt = fmt
 
-    def dump(self, manga: Manga):
-        """Dump serialized manga to dotfile"""
+    def dump(
+        self,
+        manga: Manga,
+        failed: Optional[List[Tuple[Page, Path, Exception]]] = None,
+    ):
+        """Dump serialized manga to dotfile.
+        Pages that failed to download are recorded under `failed`, along
+        with the size of their partial file, if any"""
 
         self.root.mkdir(parents=True, exist_ok=True)
         path = self.root / self.name
 
-        with path.open("w") as dotfile:
-            dotfile.write(manga.yaml())
+        dictified = {"version": self.VERSION, **manga.as_dict()}
+        if failed:
+            dictified["failed"] = [
+                self._failed(page, page_path, err) for page, page_path, err in failed
+            ]
+
+        path.write_bytes(self.serialize(dictified, self.fmt))
+
+    @staticmethod
+    def _failed(page: Page, path: Path, err: Exception) -> Dict:
+        """Serialize a failed page"""
+
+        partial = partial_path(path)
+        return {
+            **page.as_dict(),
+            "path": str(path),
+            "error": repr(err),
+            "partial": partial.stat().st_size if partial.is_file() else 0,
+        }
+
+    @classmethod
+    def serialize(cls, dictified: Dict, fmt: str = "yaml") -> bytes:
+        """Serialize a dict in the given format"""
+
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"Unsupported dotfile format {fmt}")
+
+        if fmt == "json":
+            return json.dumps(dictified, separators=(",", ":")).encode()
+
+        if fmt == "msgpack":
+            import msgpack
+
+            return msgpack.packb(dictified)
+
+        return yaml.dump(dictified, Dumper=YamlDumper).encode()
+
+    @classmethod
+    def deserialize(cls, raw: bytes) -> Dict:
+        """Deserialize a dict, detecting its format"""
+
+        # msgpack maps start with a byte in 0x80-0x8f, 0xde or 0xdf
+        if raw[:1] and (raw[0] & 0xF0 == 0x80 or raw[0] in (0xDE, 0xDF)):
+            if "msgpack" not in cls.FORMATS:
+                raise InvalidDotfile("msgpack dotfile, but msgpack is not installed")
+
+            import msgpack
+
+            dictified = msgpack.unpackb(raw)
+        elif raw.lstrip()[:1] == b"{":
+            dictified = json.loads(raw)
+        else:
+            dictified = yaml.load(raw, Loader=YamlLoader)
+
+        if not isinstance(dictified, dict):
+            raise InvalidDotfile("Dotfile content is not a mapping")
+
+        # dotfiles written before versioning have no version
+        version = dictified.get("version", cls.VERSION)
+        if version > cls.VERSION:
+            raise UnsupportedDotfile(version, cls.VERSION)
 
-    def read(self) -> Manga:
-        """Read manga from dotfile"""
+        return dictified
+
+    def load(self) -> Dict:
+        """Read the raw content of the dotfile"""
 
         path = self.root / self.name
-        content = path.read_text()
-        return Manga.from_yaml(content)
+        return self.deserialize(path.read_bytes())
+
+    def read(self, lazy: bool = True) -> Manga:
+        """Read manga from dotfile.
+        If `lazy`, the pages of each chapter are parsed on first access"""
+
+        return Manga.from_dict(self.load(), lazy)
+
+    def failed(self) -> List[Dict]:
+        """Read the pages that failed to download from dotfile"""
+
+        return self.load().get("failed", [])
+
+
+class Manifest:
+    """Pages integrity manifest.
+
+    Sidecar of the dotfile, holding a json line with the size, hash and
+    dimensions of each written page. Pages are identified by their path
+    without extension, relative to `root`
+    """
+
+    def __init__(self, root: Path, name=".haku.manifest"):
+        self.name = name
+        self.root = root
+        self.stream: Optional[IO[str]] = None
+        self._entries: Optional[Dict[str, Dict]] = None
+
+    @property
+    def path(self) -> Path:
+        """Get the manifest path"""
+
+        return self.root / self.name
+
+    def key(self, path: Path) -> str:
+        """Get the manifest key of a page"""
+
+        return path.relative_to(self.root).with_suffix("").as_posix()
+
+    @property
+    def entries(self) -> Dict[str, Dict]:
+        """Get the manifest entries, reading them on first access"""
+
+        if self._entries is None:
+            self._entries = {}
+            if self.path.is_file():
+                with self.path.open() as stream:
+                    for line in stream:
+                        # lines cut by interrupted runs leave their page unrecorded
+                        try:
+                            entry = json.loads(line)
+                            key = self.key(self.root / entry["path"])
+                        except (ValueError, TypeError, KeyError):
+                            continue
+                        self._entries[key] = entry
+
+        return self._entries
+
+    def get(self, path: Path) -> Optional[Dict]:
+        """Get the entry of the page at `path`, whatever its extension"""
+
+        return self.entries.get(self.key(path))
+
+    def record(self, path: Path, info: ImageInfo):
+        """Record a written page"""
+
+        entry = {"path": path.relative_to(self.root).as_posix(), **info._asdict()}
+        self.entries[self.key(path)] = entry
+
+        if self.stream is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.stream = self.path.open("a")
+
+            # terminate a line cut by an interrupted run
+            if self.stream.tell() > 0:
+                with self.path.open("rb") as stream:
+                    stream.seek(-1, os.SEEK_END)
+                    if stream.read(1) != b"\n":
+                        self.stream.write("\n")
+
+        self.stream.write(json.dumps(entry) + "\n")
+        self.stream.flush()
+
+    def verify(self, path: Path, deep: bool = False) -> bool:
+        """Check the page at `path` against its entry: by size, or also by
+        hash if `deep`"""
+
+        entry = self.get(path)
+        if entry is None:
+            return False
+
+        path = self.root / entry["path"]
+        if not path.is_file() or path.stat().st_size != entry["size"]:
+            return False
+
+        if deep:
+            digest = hasher()
+            digest.update(path.read_bytes())
+            return digest.hexdigest() == entry["hash"]
+
+        return True
+
+    def close(self):
+        """Close the manifest stream"""
+
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
 
 
 class FTree:
-    """Raw folder tree generator"""
+    """Raw folder tree generator.
+
+    An `ext` of `None` keeps the original extension of each page
+    """
 
     fmt_chapter: str = "{index:g} {title}"
     fmt_page: str = "{index}.{ext}"
@@ -44,13 +244,65 @@ class FTree:
         root: Path,
         manga: Manga,
         fmt="{title}",
-        ext: str = "png",
+        ext: Optional[str] = "png",
         dotman: Optional[Dotman] = None,
+        manifest: Optional[Manifest] = None,
     ):
         self.ext = ext
         self.manga = manga
         self.root = root / safe_path(fmt.format(title=manga.title))
         self.dotman = dotman or Dotman(self.root)
+        self.manifest = manifest or Manifest(self.root)
+        self.listings: Dict[Path, Tuple[int, Set[str]]] = {}
+
+    @property
+    def passthrough(self) -> bool:
+        """Check if pages are stored with their original extension"""
+
+        return self.ext is None
+
+    def page_ext(self, url: str) -> str:
+        """Get the extension of the page at `url`"""
+
+        return self.ext or url_ext(url)
+
+    @staticmethod
+    def resolve(path: Path) -> Path:
+        """Find the page at `path`, whatever its extension"""
+
+        if path.is_file():
+            return path
+
+        candidates = sorted(
+            candidate
+            for candidate in path.parent.glob(f"{glob.escape(path.stem)}.*")
+            if candidate.suffix != ".part"
+        )
+        return candidates[0] if candidates else path
+
+    def listing(self, folder: Path) -> Set[str]:
+        """List the stems of the pages in `folder`, with a single scan.
+        Listings are cached until the folder is modified"""
+
+        try:
+            mtime = folder.stat().st_mtime_ns
+        except FileNotFoundError:
+            self.listings.pop(folder, None)
+            return set()
+
+        cached = self.listings.get(folder)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with os.scandir(folder) as entries:
+            stems = {
+                Path(entry.name).stem
+                for entry in entries
+                if entry.is_file() and not entry.name.endswith(".part")
+            }
+
+        self.listings[folder] = (mtime, stems)
+        return stems
 
     def chapter(self, chapter: Chapter, fmt: Optional[str] = None) -> Path:
         """Get chapter path"""
@@ -69,8 +321,11 @@ class FTree:
         *chapters: Chapter,
         fmt: Optional[str] = None,
         fmt_page: Optional[str] = None,
+        resolve: bool = False,
     ) -> Generator[Tuple[Page, Path], None, None]:
-        """Flatten pages and paths in a list"""
+        """Flatten pages and paths in a list.
+        If `resolve`, match already existent pages whatever their extension
+        """
 
         fmt = fmt or self.fmt_chapter
         fmt_page = fmt_page or self.fmt_page
@@ -78,14 +333,18 @@ class FTree:
         for chapter in chapters:
             path = self.chapter(chapter, fmt)
             for page in chapter.pages:
-                page_path = fmt_page.format(index=page.index, ext=self.ext)
-                yield page, path / safe_path(page_path)
+                page_path = fmt_page.format(
+                    index=page.index, ext=self.page_ext(page.url)
+                )
+                page_path = path / safe_path(page_path)
+                yield page, self.resolve(page_path) if resolve else page_path
 
     def cover(self, fmt: Optional[str] = None):
         """Get cover path"""
 
         fmt = fmt or self.fmt_cover
-        return self.root / safe_path(fmt.format(ext=self.ext))
+        ext = self.page_ext(self.manga.cover or "")
+        return self.root / safe_path(fmt.format(ext=ext))
 
     def __enter__(self):
         return self
@@ -97,6 +356,8 @@ class FTree:
 class Reader:
     """Raw folder tree reader"""
 
+    SCAN_WORKERS = 16
+
     def __init__(self, tree: FTree):
         self.tree = tree
 
@@ -115,27 +376,54 @@ class Reader:
     async def page(
         self, page: Page, path: Path, mode: str = "RGB"
     ) -> List[Tuple[Page, Image.Image]]:
-        """Read page from disk"""
+        """Read page from disk, whatever its extension"""
 
-        image = Image.open(path)
+        image = Image.open(self.tree.resolve(path))
         if image.mode != mode:
             image = image.convert(mode)
         return page, image
 
+    def missing_chapter(self, chapter: Chapter) -> Chapter:
+        """Find missing pages of a chapter, whatever their extension.
+        Pages are looked up in a single listing of the chapter folder, without
+        checking their content: see `verify`"""
+
+        m_chapter = Chapter(**chapter.as_dict(add_pages=False))
+        present = self.tree.listing(self.tree.chapter(chapter))
+
+        m_chapter.pages = [
+            page
+            for page, path in self.tree.flatten(chapter)
+            if path.stem not in present
+        ]
+
+        return m_chapter
+
     def missing(self) -> Manga:
-        """Find missing pages in directory"""
+        """Find missing pages in directory, scanning chapters concurrently"""
 
-        manga = Manga(**self.tree.manga.as_dict())
-        manga.chapters = []
+        manga = Manga(**self.tree.manga.as_dict(add_chapters=False))
+        with ThreadPoolExecutor(self.SCAN_WORKERS) as pool:
+            manga.chapters = list(
+                pool.map(self.missing_chapter, self.tree.manga.chapters)
+            )
 
-        for chapter in self.tree.manga.chapters:
-            m_chapter = Chapter(**chapter.as_dict())
-            m_chapter.pages = []
+        return manga
+
+    def verify(self, deep: bool = False) -> Manga:
+        """Find the pages not matching the manifest, by size or also by hash
+        if `deep`"""
 
-            for page, path in self.tree.flatten(chapter):
-                if not path.is_file():
-                    m_chapter.pages.append(page)
+        manga = Manga(**self.tree.manga.as_dict(add_chapters=False))
+        manga.chapters = []
 
+        for chapter in self.tree.manga.chapters:
+            m_chapter = Chapter(**chapter.as_dict(add_pages=False))
+            m_chapter.pages = [
+                page
+                for page, path in self.tree.flatten(chapter)
+                if not self.tree.manifest.verify(path, deep)
+            ]
             manga.chapters.append(m_chapter)
 
         return manga
@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+from haku.exceptions import UnexpectedResponse
+
+
+class RetryPolicy:
+    """Retry policy for failed requests.
+
+    A request is tried at most `attempts` times, waiting an exponential
+    `backoff` (capped at `max_backoff` seconds) between attempts, randomized
+    by `jitter`. Responses are retried only if their status is in `statuses`,
+    honoring their `Retry-After` header when present: requests asked to wait
+    longer than `max_retry_after` seconds are not retried
+    """
+
+    STATUSES: Tuple[int] = (408, 425, 429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        attempts: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        jitter: float = 0.5,
+        statuses: Tuple[int] = STATUSES,
+        retry_after: bool = True,
+        max_retry_after: float = 300,
+    ):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = statuses
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+
+    def retry_status(self, status: int) -> bool:
+        """Check if a response with `status` should be retried"""
+
+        return status in self.statuses
+
+    def requested_delay(self, err: Optional[Exception]) -> Optional[float]:
+        """Get the delay asked by the `Retry-After` header of a response, if
+        honored"""
+
+        if self.retry_after and isinstance(err, UnexpectedResponse):
+            return parse_retry_after(err.retry_after)
+
+        return None
+
+    def exhausted(self, attempt: int, err: Optional[Exception] = None) -> bool:
+        """Check if no attempts are left after `attempt`, or if `err` asks to
+        wait too long"""
+
+        requested = self.requested_delay(err)
+        if requested is not None and requested > self.max_retry_after:
+            return True
+
+        return attempt >= self.attempts
+
+    def delay(self, attempt: int, err: Optional[Exception] = None) -> float:
+        """Compute the delay before retrying after the `attempt`-th failure"""
+
+        requested = self.requested_delay(err)
+        if requested is not None:
+            return min(self.max_retry_after, requested)
+
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a `Retry-After` header into seconds"""
+
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,75 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from haku.utils import ImageInfo, transcode_image
+
+
+class Transcoder:
+    """Image transcoder, running on a thread or process pool.
+
+    At most `backlog` images are downloaded or transcoded at the same time:
+    each download takes a slot before starting and holds it until its image
+    is written, so network and compression overlap without piling up raw
+    images in memory
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        processes: bool = False,
+        backlog: Optional[int] = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.backlog = backlog or 4 * self.workers
+
+        self.executor: Optional[Executor] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        """Start the worker pool"""
+
+        if self.executor is None:
+            pool = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+            self.executor = pool(max_workers=self.workers)
+
+    def close(self):
+        """Stop the worker pool"""
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.slots = None
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a backlog slot, from the download of an image to its write"""
+
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.backlog)
+
+        async with self.slots:
+            yield
+
+    async def __call__(
+        self, raw: bytes, path: Path, fmt: Optional[str] = None
+    ) -> ImageInfo:
+        """Transcode `raw` and write it to `path`.
+        Meant to be called while holding a slot"""
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, transcode_image, raw, path, fmt
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -1,13 +1,28 @@
 import re
+from bisect import bisect_left, bisect_right
 from functools import reduce
+from math import inf
 from numbers import Number
-from typing import Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from haku.meta import Chapter, Manga
 
 
 class Filter:
-    """Filters, to be applied to a Shelf instance"""
+    """Filters, to be applied to a Shelf instance.
+
+    Filters are built as an expression tree of nodes:
+    + `("true",)` and `("false",)`
+    + `("in", attr, values)` if the chapter `attr` is in the frozenset `values`
+    + `("range", attr, ((start, end), ...))` if the chapter `attr` is in any
+      of the sorted, disjoint intervals
+    + `("has", attr)` if the chapter `attr` is not `None`
+    + `("and", nodes)`, `("or", nodes)` and `("not", node)`
+    + `("call", f)` for opaque predicates
+
+    The tree is simplified, merging ranges and sets, and compiled into a single
+    predicate on first call
+    """
 
     @staticmethod
     def stringified(src: str):
@@ -20,8 +35,9 @@ class Filter:
         """Filter all chapters"""
 
         return Filter(
-            lambda chapter: True,
+            None,
             "True",
+            ("true",),
         )
 
     @staticmethod
@@ -29,8 +45,9 @@ class Filter:
         """Filter no chapters"""
 
         return Filter(
-            lambda chapter: False,
+            None,
             "False",
+            ("false",),
         )
 
     @staticmethod
@@ -38,8 +55,9 @@ class Filter:
         """Filter chapters if title in *titles"""
 
         return Filter(
-            lambda chapter: chapter.title in titles,
+            None,
             f"title in ({', '.join(titles)})",
+            ("in", "title", frozenset(titles)),
         )
 
     @staticmethod
@@ -47,8 +65,9 @@ class Filter:
         """Filter chapters if index in *index"""
 
         return Filter(
-            lambda chapter: chapter.index in index,
+            None,
             f"index in ({', '.join(map(str, index))})",
+            ("in", "index", frozenset(index)),
         )
 
     @staticmethod
@@ -56,8 +75,9 @@ class Filter:
         """Filter chapters if index in [start, end]"""
 
         return Filter(
-            lambda chapter: start <= chapter.index <= end,
+            None,
             f"{start} <= index <= {end}",
+            ("range", "index", ((start, end),) if start <= end else ()),
         )
 
     @staticmethod
@@ -65,8 +85,9 @@ class Filter:
         """Filter chapters if volume is not None"""
 
         return Filter(
-            lambda chapter: chapter.volume is not None,
+            None,
             "volume != None",
+            ("has", "volume"),
         )
 
     @staticmethod
@@ -74,8 +95,9 @@ class Filter:
         """Filter chapters if volume in *volumes"""
 
         return Filter.has_volume() & Filter(
-            lambda chapter: chapter.volume in volumes,
+            None,
             f"volume in ({', '.join(map(str, volumes))})",
+            ("in", "volume", frozenset(volumes)),
         )
 
     @staticmethod
@@ -83,30 +105,49 @@ class Filter:
         """Filter chapters if volue in [start, end]"""
 
         return Filter.has_volume() & Filter(
-            lambda chapter: start <= chapter.volume <= end,
+            None,
             f"{start} <= volume <= {end}",
+            ("range", "volume", ((start, end),) if start <= end else ()),
         )
 
-    def __init__(self, f: Callable[[Chapter], bool], repr: Optional[str] = None):
+    def __init__(
+        self,
+        f: Callable[[Chapter], bool],
+        repr: Optional[str] = None,
+        node: Optional[Tuple] = None,
+    ):
         self.repr = repr
-        self.f = f
+        self.node = node if node is not None else ("call", f)
+        self._compiled: Optional[Callable[[Chapter], bool]] = None
+
+    @property
+    def f(self) -> Callable[[Chapter], bool]:
+        """Get the compiled predicate"""
+
+        if self._compiled is None:
+            self._compiled = self.compile(self.node)
+
+        return self._compiled
 
     def __and__(self, other):
         return Filter(
-            lambda chapter: self.f(chapter) and other.f(chapter),
+            None,
             f"({self.repr}) & ({other.repr})",
+            ("and", (self.node, other.node)),
         )
 
     def __or__(self, other):
         return Filter(
-            lambda chapter: self.f(chapter) or other.f(chapter),
+            None,
             f"({self.repr}) | ({other.repr})",
+            ("or", (self.node, other.node)),
         )
 
     def __invert__(self):
         return Filter(
-            lambda chapter: not self.f(chapter),
+            None,
             f"!({self.repr})",
+            ("not", self.node),
         )
 
     @staticmethod
@@ -127,6 +168,180 @@ class Filter:
 
         return ~f
 
+    @staticmethod
+    def _merge_ranges(ranges: List[Tuple[Number, Number]]) -> Tuple:
+        """Merge overlapping intervals"""
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+
+        return tuple(merged)
+
+    @staticmethod
+    def _intersect_ranges(a: Tuple, b: Tuple) -> Tuple:
+        """Intersect two sets of disjoint intervals"""
+
+        intersected = (
+            (max(a_start, b_start), min(a_end, b_end))
+            for a_start, a_end in a
+            for b_start, b_end in b
+        )
+
+        return tuple(sorted((start, end) for start, end in intersected if start <= end))
+
+    @staticmethod
+    def _in_ranges(value: Number, ranges: Tuple) -> bool:
+        """Check if `value` is in any of the sorted, disjoint intervals"""
+
+        i = bisect_right(ranges, (value, inf)) - 1
+        return i >= 0 and value <= ranges[i][1]
+
+    @classmethod
+    def simplify(cls, node: Tuple) -> Tuple:
+        """Simplify an expression tree"""
+
+        kind = node[0]
+
+        if kind == "in" and len(node[2]) == 0:
+            return ("false",)
+
+        if kind == "range" and len(node[2]) == 0:
+            return ("false",)
+
+        if kind == "not":
+            child = cls.simplify(node[1])
+            if child[0] in ("true", "false"):
+                return ("false",) if child[0] == "true" else ("true",)
+            return child[1] if child[0] == "not" else ("not", child)
+
+        if kind not in ("and", "or"):
+            return node
+
+        # flatten nested nodes of the same kind
+        children = []
+        for child in map(cls.simplify, node[1]):
+            children.extend(child[1] if child[0] == kind else [child])
+
+        absorbing, neutral = ("false", "true") if kind == "and" else ("true", "false")
+        if any(child[0] == absorbing for child in children):
+            return (absorbing,)
+        children = [child for child in children if child[0] != neutral]
+
+        # merge sets and ranges on the same attribute
+        sets: Dict[str, frozenset] = {}
+        ranges: Dict[str, Tuple] = {}
+        others = []
+        for child in children:
+            if child[0] == "in" and kind == "or":
+                sets[child[1]] = sets.get(child[1], frozenset()) | child[2]
+            elif child[0] == "in":
+                sets[child[1]] = sets.get(child[1], child[2]) & child[2]
+            elif child[0] == "range" and kind == "or":
+                ranges[child[1]] = cls._merge_ranges(
+                    [*ranges.get(child[1], ()), *child[2]]
+                )
+            elif child[0] == "range":
+                ranges[child[1]] = cls._intersect_ranges(
+                    ranges.get(child[1], child[2]), child[2]
+                )
+            else:
+                others.append(child)
+
+        if kind == "or":
+            # values already covered by a range are redundant
+            for attr, values in sets.items():
+                sets[attr] = frozenset(
+                    value
+                    for value in values
+                    if value is None
+                    or attr not in ranges
+                    or not cls._in_ranges(value, ranges[attr])
+                )
+        else:
+            # ranges and sets without None imply `has`
+            implied = {*ranges, *(attr for attr, v in sets.items() if None not in v)}
+            others = [
+                child
+                for child in others
+                if not (child[0] == "has" and child[1] in implied)
+            ]
+
+        children = [
+            *(cls.simplify(("in", attr, values)) for attr, values in sets.items()),
+            *(cls.simplify(("range", attr, rng)) for attr, rng in ranges.items()),
+            *others,
+        ]
+
+        if any(child[0] == absorbing for child in children):
+            return (absorbing,)
+        children = [child for child in children if child[0] != neutral]
+
+        if len(children) == 0:
+            return (neutral,)
+        if len(children) == 1:
+            return children[0]
+        return (kind, tuple(children))
+
+    @classmethod
+    def _compile(cls, node: Tuple) -> Callable[[Chapter], Any]:
+        """Compile a simplified expression tree into nested predicates"""
+
+        kind = node[0]
+
+        if kind == "true":
+            return lambda chapter: True
+
+        if kind == "false":
+            return lambda chapter: False
+
+        if kind == "in":
+            attr, values = node[1], node[2]
+            return lambda chapter: getattr(chapter, attr) in values
+
+        if kind == "has":
+            attr = node[1]
+            return lambda chapter: getattr(chapter, attr) is not None
+
+        if kind == "range":
+            attr, ranges = node[1], node[2]
+
+            if len(ranges) == 1:
+                start, end = ranges[0]
+
+                def in_range(chapter: Chapter) -> bool:
+                    value = getattr(chapter, attr)
+                    return value is not None and start <= value <= end
+
+                return in_range
+
+            def in_ranges(chapter: Chapter) -> bool:
+                value = getattr(chapter, attr)
+                return value is not None and cls._in_ranges(value, ranges)
+
+            return in_ranges
+
+        if kind == "not":
+            child = cls._compile(node[1])
+            return lambda chapter: not child(chapter)
+
+        if kind in ("and", "or"):
+            children = tuple(map(cls._compile, node[1]))
+            combine = all if kind == "and" else any
+            return lambda chapter: combine(child(chapter) for child in children)
+
+        return node[1]
+
+    @classmethod
+    def compile(cls, node: Tuple) -> Callable[[Chapter], bool]:
+        """Compile an expression tree into a single predicate"""
+
+        predicate = cls._compile(cls.simplify(node))
+        return lambda chapter: bool(predicate(chapter))
+
     def __repr__(self):
         """Filter repr"""
 
@@ -231,6 +446,25 @@ class Shelf:
         self.manga.chapters.sort(key=lambda chapter: (chapter.index, chapter.volume))
         return self
 
+    def reuse_pages(self, previous: Manga) -> List[Chapter]:
+        """Reuse the pages of the chapters unchanged since `previous`.
+        Returns the chapters that are new, changed or without pages"""
+
+        def key(chapter: Chapter) -> Tuple[str, Number, str]:
+            return chapter.url, chapter.index, chapter.title
+
+        known = {key(chapter): chapter for chapter in previous.chapters or []}
+
+        changed = []
+        for chapter in self.manga.chapters:
+            old = known.get(key(chapter))
+            if old is not None and old.pages:
+                chapter.pages = old.pages
+            else:
+                changed.append(chapter)
+
+        return changed
+
     def split_volumes(self) -> Dict[Number, List[Chapter]]:
         """Split manga into volumes"""
 
@@ -249,13 +483,29 @@ class Shelf:
         """
 
         mapping_re = r"([\d\.]+){([\d\.]+)?:([\d\.]+)?}"
-        for match in re.finditer(mapping_re, mod):
+        table = [
+            (
+                float(match.group(1)),
+                float(match.group(2) or 0),
+                float(match.group(3) or len(self.manga.chapters)),
+            )
+            for match in re.finditer(mapping_re, mod)
+        ]
+
+        return self.map_volumes(table)
+
+    def map_volumes(self, table: List[Tuple[Number, Number, Number]]):
+        """Override volumes from a table of `(volume, start, end)` rows, setting
+        `volume` to the chapters with index in `[start, end]`. Later rows win
+        over earlier ones"""
+
+        chapters = sorted(self.manga.chapters, key=lambda chapter: chapter.index)
+        indices = [chapter.index for chapter in chapters]
+
+        for volume, start, end in table:
+            lo = bisect_left(indices, start)
+            hi = bisect_right(indices, end)
+            for chapter in chapters[lo:hi]:
+                chapter.volume = volume
 
-            volume = float(match.group(1))
-            start = float(match.group(2) or 0)
-            end = float(match.group(3) or len(self.manga.chapters))
-
-            chapter_filter = Filter.index_range(start, end)
-            for chapter in self.manga.chapters:
-                if chapter_filter(chapter):
-                    chapter.volume = volume
+        return self
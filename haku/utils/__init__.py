@@ -1,9 +1,12 @@
+import hashlib
 import os
 import re
 import shutil
 import tempfile
+from io import BytesIO
 from pathlib import Path
-from typing import IO, Any, Callable, List, Optional, Union
+from typing import IO, Any, Callable, List, NamedTuple, Optional, Union
+from urllib.parse import urlparse
 
 from PIL import Image
 
@@ -40,17 +43,79 @@ def chunks(lst, n):
         yield lst[i : i + n]
 
 
+def partial_path(path: Path) -> Path:
+    """Get the path of the partial file written before `path`"""
+
+    return path.with_name(f"{path.name}.part")
+
+
+def validator_path(path: Path) -> Path:
+    """Get the path holding the validator of the partial file of `path`"""
+
+    return path.with_name(f"{path.name}.validator.part")
+
+
 def write_image(image: Image.Image, path: Path, fmt="png", cleanup=True):
-    """Write an image to disk"""
+    """Write an image to disk, atomically.
+    If `fmt` is `None`, the format is inferred from `path`"""
+
+    fmt = fmt or Image.registered_extensions().get(path.suffix.lower())
+    partial = partial_path(path)
 
     path.parent.mkdir(parents=True, exist_ok=True)
-    image.save(str(path), format=fmt)
+    image.save(str(partial), format=fmt)
+    os.replace(partial, path)
 
     if cleanup:
         image.close()
         del image
 
 
+class ImageInfo(NamedTuple):
+    """Written image info"""
+
+    size: int
+    hash: str
+    width: int
+    height: int
+
+
+def hasher() -> Any:
+    """Get the hasher used for written images"""
+
+    return hashlib.blake2b(digest_size=16)
+
+
+def transcode_image(raw: bytes, path: Path, fmt: Optional[str] = None) -> ImageInfo:
+    """Decode an encoded image and write it to disk, atomically.
+    If `fmt` is `None`, the format is inferred from `path`"""
+
+    fmt = fmt or Image.registered_extensions().get(path.suffix.lower())
+    encoded = BytesIO()
+
+    with Image.open(BytesIO(raw)) as image:
+        width, height = image.size
+        image.save(encoded, format=fmt)
+
+    data = encoded.getvalue()
+    partial = partial_path(path)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial.write_bytes(data)
+    os.replace(partial, path)
+
+    digest = hasher()
+    digest.update(data)
+    return ImageInfo(len(data), digest.hexdigest(), width, height)
+
+
+def url_ext(url: str, default: str = "png") -> str:
+    """Get the file extension of an url"""
+
+    ext = Path(urlparse(url).path).suffix.lstrip(".").lower()
+    return ext or default
+
+
 def ensure_bytesio(
     candidate: Union[Path, IO[bytes]], mode="wb"
 ) -> Union[IO[bytes], bool]:
@@ -0,0 +1,183 @@
+import sqlite3
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from time import monotonic, time
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+from haku.utils import tmpdir
+
+
+class Cache:
+    """LRU cache with size accounting.
+
+    Entries are evicted, least recently used first, when there are more than
+    `max_items` of them or their total size exceeds `max_bytes`. Entries older
+    than `ttl` seconds are dropped on access. Sizes are computed with `sizeof`,
+    unless given explicitly when setting an entry
+    """
+
+    def __init__(
+        self,
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+
+    def expired(self, key: Hashable) -> bool:
+        """Check if an entry is expired"""
+
+        _, _, created = self.entries[key]
+        return self.ttl is not None and monotonic() - created > self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an entry, marking it as recently used"""
+
+        if key not in self:
+            return default
+
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None):
+        """Set an entry, evicting the least recently used ones if needed"""
+
+        self.pop(key)
+
+        size = self.sizeof(value) if size is None else size
+        self.entries[key] = (value, size, monotonic())
+        self.size += size
+
+        self.evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry"""
+
+        if key not in self.entries:
+            return default
+
+        value, size, _ = self.entries.pop(key)
+        self.size -= size
+        return value
+
+    def evict(self):
+        """Evict entries until the cache fits its budget"""
+
+        while self.entries and (
+            (self.max_items is not None and len(self.entries) > self.max_items)
+            or (self.max_bytes is not None and self.size > self.max_bytes)
+        ):
+            self.pop(next(iter(self.entries)))
+
+    def clear(self):
+        """Remove all the entries"""
+
+        self.entries.clear()
+        self.size = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key not in self.entries:
+            return False
+
+        if self.expired(key):
+            self.pop(key)
+            return False
+
+        return True
+
+    def __getitem__(self, key: Hashable) -> Any:
+        if key not in self:
+            raise KeyError(key)
+
+        return self.get(key)
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self.set(key, value)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class HttpEntry(NamedTuple):
+    """Cached http response"""
+
+    body: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class HttpCache:
+    """Persistent http cache, backed by sqlite.
+
+    Stores the body, `ETag` and `Last-Modified` of each response, so that
+    later requests can be revalidated with `If-None-Match` and
+    `If-Modified-Since`
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or tmpdir() / "http.sqlite"
+        self.db: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database, if not already open"""
+
+        if self.db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(str(self.path))
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, body TEXT, etag TEXT, last_modified TEXT, "
+                "stored REAL)"
+            )
+
+        return self.db
+
+    def get(self, url: str) -> Optional[HttpEntry]:
+        """Get the cached response of `url`"""
+
+        query = "SELECT body, etag, last_modified FROM responses WHERE url = ?"
+        row = self.connect().execute(query, (url,)).fetchone()
+
+        return HttpEntry(*row) if row is not None else None
+
+    def set(self, url: str, entry: HttpEntry):
+        """Store the response of `url`"""
+
+        db = self.connect()
+        db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (url, entry.body, entry.etag, entry.last_modified, time()),
+        )
+        db.commit()
+
+    @staticmethod
+    def validators(entry: Optional[HttpEntry]) -> Dict[str, str]:
+        """Get the conditional request headers to revalidate `entry`"""
+
+        if entry is None:
+            return {}
+
+        headers = {}
+        if entry.etag is not None:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified is not None:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        return headers
+
+    def close(self):
+        """Close the database"""
+
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -82,6 +82,12 @@ class Progress(Renderable):
 
         self.to(self.position + delta)
 
+    def extend(self, delta: int):
+        """Change the total by delta"""
+
+        self.tot += delta
+        self.console.print(self)
+
     def __enter__(self):
         self.console.hide_cursor()
         self.console.print(self)
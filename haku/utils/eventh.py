@@ -1,10 +1,21 @@
-from typing import Any, Callable, Dict, List, Optional
+from contextlib import contextmanager
+from multiprocessing import SimpleQueue
+from threading import Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 from haku.utils import call_safe
 
+# queue the events emitted in this process are forwarded to, if any
+_forwarding: Optional[SimpleQueue] = None
+
 
 class Handler:
-    """Event handler"""
+    """Event handler.
+
+    Events can cross processes: a worker process started with `forward_to`
+    emits events on a queue, and a handler relaying that queue dispatches them
+    to its listeners in the parent process
+    """
 
     K_SEP: str = "."
     K_END: str = "end"
@@ -38,6 +49,49 @@ class Handler:
 
         return self
 
+    @staticmethod
+    def forward_to(queue: SimpleQueue):
+        """Forward the events emitted in this process to `queue`.
+        Meant as initializer of worker processes"""
+
+        global _forwarding
+        _forwarding = queue
+
+    @staticmethod
+    def emit(key: str, *args: Any):
+        """Emit an event from a worker process, if forwarding"""
+
+        if _forwarding is not None:
+            _forwarding.put((key, args))
+
+    @contextmanager
+    def relay(self, queue: SimpleQueue) -> Iterator["Handler"]:
+        """Dispatch the events forwarded to `queue`, from a thread draining it
+        while in context.
+        The queue is drained even if a listener raises, so that workers never
+        block on it: the first exception is re-raised on exit"""
+
+        errors: List[Exception] = []
+
+        def drain():
+            for key, args in iter(queue.get, None):
+                try:
+                    self.dispatch(key, *args)
+                except Exception as err:
+                    errors.append(err)
+
+        thread = Thread(target=drain, daemon=True)
+        thread.start()
+
+        try:
+            yield self
+        finally:
+            queue.put(None)
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
     def ping(self, key: str, cbk: Callable = print):
         """Ping an event"""
 
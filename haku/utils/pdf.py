@@ -0,0 +1,222 @@
+import struct
+import zlib
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+
+class PdfWriter:
+    """Streaming pdf writer, one image per page.
+
+    Pages are written to `stream` as soon as they are added, so only one of
+    them is in memory at a time. Jpeg images and plain png images are embedded
+    as they are, while the others are decoded and compressed losslessly.
+    Pages are sized as the images printed at `dpi`, and can be bookmarked in
+    the document outline
+    """
+
+    HEADER: bytes = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+
+    # jpeg modes embeddable as they are, with their pdf color space
+    DCT_MODES: Dict[str, Tuple[str, str]] = {
+        "L": ("/DeviceGray", ""),
+        "RGB": ("/DeviceRGB", ""),
+        # adobe jpegs store inverted cmyk
+        "CMYK": ("/DeviceCMYK", " /Decode [1 0 1 0 1 0 1 0]"),
+    }
+
+    def __init__(self, stream: IO[bytes], dpi: float = 100.0):
+        self.stream = stream
+        self.dpi = dpi
+
+        self.offsets: Dict[int, Optional[int]] = {}
+        self.pages: List[int] = []
+        self.bookmarks: List[Tuple[str, int]] = []
+        self.written = 0
+        self.closed = False
+
+        # reserve the ids of the catalog and of the pages tree
+        self.catalog_id = self.reserve()
+        self.tree_id = self.reserve()
+
+        self.write(self.HEADER)
+
+    def write(self, data: bytes):
+        """Write raw data, keeping track of the offset"""
+
+        self.stream.write(data)
+        self.written += len(data)
+
+    def reserve(self) -> int:
+        """Reserve an object id"""
+
+        obj_id = len(self.offsets) + 1
+        self.offsets[obj_id] = None
+        return obj_id
+
+    def obj(self, obj_id: int, body: bytes, stream: Optional[bytes] = None):
+        """Write an object, with an optional stream"""
+
+        self.offsets[obj_id] = self.written
+        self.write(b"%d 0 obj\n" % obj_id + body)
+        if stream is not None:
+            self.write(b"\nstream\n")
+            self.write(stream)
+            self.write(b"\nendstream")
+        self.write(b"\nendobj\n")
+
+    @staticmethod
+    def png(path: Path) -> Optional[Tuple[bytes, int]]:
+        """Get the compressed data and the number of colors of a png, if they
+        can be embedded as they are: 8 bit grayscale or rgb, not interlaced"""
+
+        raw = path.read_bytes()
+        if raw[:8] != b"\x89PNG\r\n\x1a\n":
+            return None
+
+        _, _, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", raw[16:29])
+        if depth != 8 or color not in (0, 2) or interlace != 0:
+            return None
+
+        # concatenate the data of the IDAT chunks
+        data, offset = [], 8
+        while offset < len(raw):
+            length, kind = struct.unpack(">I4s", raw[offset : offset + 8])
+            if kind == b"IDAT":
+                data.append(raw[offset + 8 : offset + 8 + length])
+            offset += length + 12
+
+        return b"".join(data), 1 if color == 0 else 3
+
+    def image(self, path: Path) -> Tuple[int, int, int]:
+        """Write the image at `path` as an XObject.
+        Returns its id and size"""
+
+        with Image.open(path) as image:
+            width, height = image.size
+
+            png = self.png(path) if image.format == "PNG" else None
+
+            if image.format == "JPEG" and image.mode in self.DCT_MODES:
+                space, decode = self.DCT_MODES[image.mode]
+                data = path.read_bytes()
+                fltr = "/DCTDecode"
+
+            elif png is not None:
+                space, decode = self.DCT_MODES[image.mode]
+                data, colors = png
+                fltr = "/FlateDecode /DecodeParms << /Predictor 15 "
+                fltr += f"/Colors {colors} /BitsPerComponent 8 /Columns {width} >>"
+
+            else:
+                if image.mode not in ("L", "RGB"):
+                    image = image.convert("RGB")
+                space, decode = self.DCT_MODES[image.mode]
+                data = zlib.compress(image.tobytes())
+                fltr = "/FlateDecode"
+
+        header = (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {space} /BitsPerComponent 8 /Filter {fltr}{decode} "
+            f"/Length {len(data)} >>"
+        )
+        obj_id = self.reserve()
+        self.obj(obj_id, header.encode(), data)
+
+        return obj_id, width, height
+
+    def add_page(self, path: Path) -> int:
+        """Add a page holding the image at `path`.
+        Returns the page number, starting from `0`"""
+
+        image_id, width, height = self.image(path)
+        width, height = width * 72 / self.dpi, height * 72 / self.dpi
+
+        content = f"q {width:.4f} 0 0 {height:.4f} 0 0 cm /Im0 Do Q".encode()
+        content_id = self.reserve()
+        self.obj(content_id, b"<< /Length %d >>" % len(content), content)
+
+        page_id = self.reserve()
+        page = (
+            f"<< /Type /Page /Parent {self.tree_id} 0 R "
+            f"/MediaBox [0 0 {width:.4f} {height:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        )
+        self.obj(page_id, page.encode())
+        self.pages.append(page_id)
+
+        return len(self.pages) - 1
+
+    def bookmark(self, title: str, page: int):
+        """Add a bookmark to the `page`-th page"""
+
+        self.bookmarks.append((title, page))
+
+    @staticmethod
+    def text(src: str) -> str:
+        """Encode a pdf text string"""
+
+        return f"<FEFF{src.encode('utf-16-be').hex().upper()}>"
+
+    def outline(self) -> Optional[int]:
+        """Write the outline of the bookmarks.
+        Returns its id"""
+
+        if len(self.bookmarks) == 0:
+            return None
+
+        outline_id = self.reserve()
+        ids = [self.reserve() for _ in self.bookmarks]
+
+        for i, (title, page) in enumerate(self.bookmarks):
+            item = f"<< /Title {self.text(title)} /Parent {outline_id} 0 R "
+            item += f"/Dest [{self.pages[page]} 0 R /Fit]"
+            if i > 0:
+                item += f" /Prev {ids[i - 1]} 0 R"
+            if i < len(ids) - 1:
+                item += f" /Next {ids[i + 1]} 0 R"
+            self.obj(ids[i], f"{item} >>".encode())
+
+        outline = f"<< /Type /Outlines /First {ids[0]} 0 R /Last {ids[-1]} 0 R "
+        outline += f"/Count {len(ids)} >>"
+        self.obj(outline_id, outline.encode())
+
+        return outline_id
+
+    def close(self):
+        """Write the document structure and the trailer"""
+
+        if self.closed:
+            return
+
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.pages)
+        tree = f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>"
+        self.obj(self.tree_id, tree.encode())
+
+        outline_id = self.outline()
+        catalog = f"<< /Type /Catalog /Pages {self.tree_id} 0 R"
+        if outline_id is not None:
+            catalog += f" /Outlines {outline_id} 0 R /PageMode /UseOutlines"
+        catalog += " >>"
+        self.obj(self.catalog_id, catalog.encode())
+
+        xref = self.written
+        self.write(b"xref\n0 %d\n" % (len(self.offsets) + 1))
+        self.write(b"0000000000 65535 f \n")
+        for obj_id in sorted(self.offsets):
+            self.write(b"%010d 00000 n \n" % self.offsets[obj_id])
+
+        trailer = f"trailer\n<< /Size {len(self.offsets) + 1} "
+        trailer += f"/Root {self.catalog_id} 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+        self.write(trailer.encode())
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, *_):
+        # an incomplete document is left without trailer
+        if kind is None:
+            self.close()